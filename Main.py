@@ -1,243 +1,2567 @@
-from flask import Flask, render_template_string, request, redirect, url_for, send_file, flash
-import csv, os, re, io
+from flask import Flask, Response, render_template, request, redirect, url_for, send_file, send_from_directory, flash, abort, stream_with_context
+import bisect, calendar, contextvars, cProfile, csv, difflib, hashlib, heapq, hmac, itertools, json, multiprocessing, os, pstats, re, io, queue, shutil, sqlite3, struct, subprocess, sys, tempfile, threading, time, uuid
+from array import array
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from collections import OrderedDict, deque, namedtuple
 from datetime import date, datetime
+from functools import lru_cache, wraps
+from urllib.parse import parse_qs
 import speech_recognition as sr
+from werkzeug.utils import secure_filename
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 app = Flask(__name__)
 app.secret_key = "secret123"
 
 STUDENTS_FILE = "students.csv"
+# Legacy single-file log, migrated into ATTENDANCE_DIR on first start
 ATTENDANCE_FILE = "attendance.csv"
+# One append-only CSV per year-month, e.g. attendance/2025-09.csv
+ATTENDANCE_DIR = "attendance"
+SQLITE_FILE = "attendance.db"
+# "csv" (default) or "sqlite"
+STORAGE_BACKEND = os.environ.get("ATTENDANCE_BACKEND", "csv").lower()
+STUDENT_FIELDS = ["Name", "Class", "RollNo"]
+ATTENDANCE_FIELDS = ["Date", "Name", "Class", "RollNo", "Status"]
+# Attendance files are append-only logs; superseded rows are folded away after this many appends
+COMPACT_EVERY = int(os.environ.get("ATTENDANCE_COMPACT_EVERY", "1000"))
 
-# Ensure CSV files exist
-if not os.path.exists(STUDENTS_FILE):
-    with open(STUDENTS_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Name", "Class", "RollNo"])
+# ----------------- METRICS -----------------
+# ATTENDANCE_METRICS=1 times storage, aggregation, template rendering, PDF builds and voice recognition per
+# route, counts the rows read, and serves it all at /metrics in the Prometheus text format. When it is off,
+# span() hands back the undecorated function and the request hooks are never installed.
+METRICS_ENABLED = os.environ.get("ATTENDANCE_METRICS", "0") == "1"
+# Latency histogram bucket bounds, in seconds
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 
-if not os.path.exists(ATTENDANCE_FILE):
-    with open(ATTENDANCE_FILE, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["Date", "Name", "Class", "RollNo", "Status"])
+def prom_labels(labels):
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+class Metrics:
+    # Histograms and counters keyed by (metric, ((label, value), ...)). The route label is the request
+    # being served on the current thread; the write queue and the pdf/voice pools report "background".
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def route(self):
+        return getattr(self.local, "route", None) or "background"
+
+    def observe(self, name, labels, seconds):
+        slot = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            h = self.histograms.get((name, labels))
+            if h is None:
+                # A count per bucket plus one past the last bound, then the sum
+                h = self.histograms[(name, labels)] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[slot] += 1
+            h[-1] += seconds
+
+    def count(self, name, labels, n=1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + n
+
+    def render(self):
+        with self.lock:
+            histograms = sorted((k, list(v)) for k, v in self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines, typed = [], set()
+        for (name, labels), h in histograms:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            total = 0
+            for bound, n in zip(self.buckets + ("+Inf",), h):
+                total += n
+                lines.append(f"{name}_bucket{prom_labels(labels + (('le', bound),))} {total}")
+            lines.append(f"{name}_sum{prom_labels(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{prom_labels(labels)} {total}")
+        for (name, labels), n in counters:
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{prom_labels(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(METRICS_BUCKETS)
+
+def span(name):
+    # Decorator recording each call's duration as attendance_span_seconds{span=name}
+    def decorate(fn):
+        if not METRICS_ENABLED:
+            return fn
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.observe("attendance_span_seconds", (("span", name), ("route", metrics.route())), time.perf_counter() - start)
+        return timed
+    return decorate
+
+def scanned(backend, table, rows, nbytes=0):
+    # Rows handed out by a backend (from the database or the CSV partitions' index) and bytes read from CSV files
+    if METRICS_ENABLED:
+        labels = (("backend", backend), ("table", table), ("route", metrics.route()))
+        if rows:
+            metrics.count("attendance_rows_scanned_total", labels, rows)
+        if nbytes:
+            metrics.count("attendance_bytes_read_total", labels, nbytes)
+    if PROFILE_TOKEN:
+        tally = scan_tally.get()
+        if tally is not None:
+            tally[0] += rows
+            tally[1] += nbytes
+
+render_template = span("template.render")(render_template)
+
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_metrics():
+        metrics.local.route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.local.started = time.perf_counter()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        labels = (("route", metrics.local.route), ("method", request.method), ("status", str(response.status_code)))
+        started = metrics.local.started
+        def finish():
+            metrics.observe("attendance_request_seconds", labels, time.perf_counter() - started)
+            metrics.local.route = None
+        # Generated bodies (the CSV export) are still to be produced, so those are timed until the response
+        # closes; files go to the server as they are and never report closing
+        if response.is_streamed and not response.direct_passthrough:
+            response.call_on_close(finish)
+        else:
+            finish()
+        return response
+
+# ----------------- PROFILING -----------------
+# With PROFILE_TOKEN set, a request sent with the header X-Profile: <token> (or ?profile=<token>) is profiled
+# into PROFILE_DIR: <id>.prof (cProfile; open with pstats or snakeviz) and <id>.txt with the top functions, or
+# with X-Profile-Mode: stacks (?profile_mode=stacks) <id>.folded, every thread's stack sampled for
+# flamegraph.pl or speedscope. <id>.json records the route, status, time, and the rows and bytes read.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_SECONDS = 0.005
+PROFILE_TOP_FUNCTIONS = 60
+# Pool threads parked in these modules are idle and left out of stack samples
+PROFILE_IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", "socketserver.py", "thread.py")
+# [rows, bytes] read on behalf of the request being profiled; the pdf and voice pools inherit it
+scan_tally = contextvars.ContextVar("scan_tally", default=None)
+profile_lock = threading.Lock()
+
+def profile_requested(token):
+    return bool(PROFILE_TOKEN and token) and hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode())
+
+class StackSampler:
+    # Counts the folded stacks ("thread;outer;...;inner") of every busy thread until stopped
+    def __init__(self, interval, main_thread):
+        self.interval = interval
+        self.main_thread = main_thread
+        self.stacks = {}
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        names = {}
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == self.thread.ident:
+                    continue
+                if ident != self.main_thread and os.path.basename(frame.f_code.co_filename) in PROFILE_IDLE_MODULES:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                key = ";".join([names.get(ident, str(ident))] + stack[::-1])
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+class ProfileMiddleware:
+    # Only installed when PROFILE_TOKEN is set. A profiled response is produced in full before it is
+    # returned, so streamed bodies are measured too; profiled requests run one at a time. Event streams
+    # never finish, so they are passed through unprofiled.
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        query = environ.get("QUERY_STRING", "")
+        args = parse_qs(query) if "profile" in query else {}
+        token = environ.get("HTTP_X_PROFILE") or args.get("profile", [""])[0]
+        if not profile_requested(token):
+            return self.wsgi_app(environ, start_response)
+        mode = environ.get("HTTP_X_PROFILE_MODE") or args.get("profile_mode", ["cprofile"])[0]
+        with profile_lock:
+            return contextvars.copy_context().run(self.profile, environ, start_response, mode)
+
+    def profile(self, environ, start_response, mode):
+        profile_id = f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+        response = []
+        def capture(status, headers, exc_info=None):
+            response[:] = [status, headers + [("X-Profile-Id", profile_id)], exc_info]
+        tally = [0, 0]
+        scan_tally.set(tally)
+        profiler = cProfile.Profile() if mode != "stacks" else None
+        sampler = StackSampler(PROFILE_SAMPLE_SECONDS, threading.get_ident()) if mode == "stacks" else None
+        start = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        if sampler:
+            sampler.start()
+        try:
+            result = self.wsgi_app(environ, capture)
+            streaming = any(k.lower() == "content-type" and v.startswith("text/event-stream") for k, v in response[1])
+            if not streaming:
+                try:
+                    body = b"".join(result)
+                finally:
+                    if hasattr(result, "close"):
+                        result.close()
+        finally:
+            if sampler:
+                sampler.stop()
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - start
+        if streaming:
+            start_response(response[0], [h for h in response[1] if h[0] != "X-Profile-Id"], response[2])
+            return result
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, profile_id)
+        if profiler:
+            profiler.dump_stats(path + ".prof")
+            with open(path + ".txt", "w") as f:
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        else:
+            with open(path + ".folded", "w") as f:
+                f.writelines(f"{stack} {n}\n" for stack, n in sorted(sampler.stacks.items()))
+        with open(path + ".json", "w") as f:
+            json.dump({"id": profile_id, "mode": "stacks" if sampler else "cprofile", "method": environ["REQUEST_METHOD"],
+                       "path": environ.get("PATH_INFO", ""), "status": int(response[0].split(" ", 1)[0]),
+                       "seconds": round(elapsed, 6), "rows_scanned": tally[0], "bytes_read": tally[1]}, f, indent=2)
+        start_response(*response)
+        return [body]
+
+# ----------------- REPORT CACHE -----------------
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "64"))
+
+class ReportCache:
+    # LRU of derived month reports keyed by (kind, month, year, *filters). Each entry remembers the month's
+    # data version it was built from, so writes from other processes invalidate it too; writes in this
+    # process drop the month's entries straight away.
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, value):
+        with self.lock:
+            self.entries[key] = (version, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, months):
+        with self.lock:
+            for key in [k for k in self.entries if (k[2], k[1]) in months]:
+                del self.entries[key]
+
+# ----------------- STORAGE -----------------
+def resolve_attendance(f):
+    # Last write wins: a later row for the same (Date, RollNo) replaces the earlier one in place
+    latest = {}
+    for r in csv.DictReader(f):
+        latest[(r["Date"], r["RollNo"])] = r
+    return list(latest.values())
+
+@lru_cache(maxsize=8192)
+def day_of(on_date):
+    try:
+        return datetime.strptime(on_date, "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def month_of(on_date):
+    d = day_of(on_date)
+    return (d.year, d.month) if d else None
+
+def month_bounds(month, year):
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+def month_key(on_date):
+    ym = month_of(on_date)
+    return f"{ym[0]:04d}-{ym[1]:02d}" if ym else None
+
+STATUSES = ("Present", "Absent", "Unclear")
+
+def status_column(status):
+    return status if status in ("Present", "Absent") else "Unclear"
+
+def checked_marks(marks):
+    # (Date, RollNo, Status) marks with "present" read as "Present"; None if any status is not one of STATUSES
+    checked = [(on_date, rollno, str(status).capitalize()) for on_date, rollno, status in marks]
+    return checked if all(status in STATUSES for _, _, status in checked) else None
+
+@span("aggregate.summarize")
+def summarize_month(rows):
+    report = {}
+    for r in rows:
+        key = (r["Name"], r["Class"])
+        if key not in report:
+            report[key] = {"Name": r["Name"], "Class": r["Class"], "Present": 0, "Absent": 0, "Unclear": 0}
+        report[key][status_column(r["Status"])] += 1
+    return report
+
+try:
+    import fcntl
+
+    def lock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+    def unlock_fd(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+except ImportError:
+    import msvcrt
+
+    def lock_fd(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+
+    def unlock_fd(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+class FileLock:
+    # Exclusive lock on a sidecar file, shared by every process using the same data; re-entrant per process
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.fd = None
+
+    def __enter__(self):
+        self.lock.acquire()
+        if self.depth == 0:
+            try:
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+                lock_fd(self.fd)
+            except BaseException:
+                if self.fd is not None:
+                    os.close(self.fd)
+                    self.fd = None
+                self.lock.release()
+                raise
+        self.depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self.depth -= 1
+        if self.depth == 0:
+            unlock_fd(self.fd)
+            os.close(self.fd)
+            self.fd = None
+        self.lock.release()
+
+class AtomicWriter:
+    # Writes go to a temp file next to path; commit() fsyncs it and renames it over path in one step,
+    # so readers and crashes only ever see the old or the new file
+    def __init__(self, path):
+        fd, self.tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".", suffix=".tmp")
+        self.path = path
+        self.file = os.fdopen(fd, "w", newline="")
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.tmp, self.path)
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type or self.file.closed:
+            self.discard()
+        else:
+            self.commit()
+
+def append_durably(path, text):
+    with open(path, "a", newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+def csv_text(rows, fieldnames, header=False):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fieldnames)
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue()
+
+class WriteQueue:
+    # Single writer thread: marks submitted concurrently are drained together and committed as one batch
+    def __init__(self, commit):
+        self.commit = commit
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, marks):
+        job = Future()
+        self.queue.put((list(marks), job))
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+        return job.result()
+
+    def run(self):
+        while True:
+            jobs = [self.queue.get()]
+            while True:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.commit([m for marks, _ in jobs for m in marks])
+            except Exception as e:
+                for _, job in jobs:
+                    job.set_exception(e)
+            else:
+                for _, job in jobs:
+                    job.set_result(None)
+
+# Backend methods timed as storage.<name> spans
+STORAGE_SPANS = ("load_students", "add_students", "delete_student", "student_changes", "commit_marks", "get_attendance",
+                 "attendance_on", "attendance_for", "day_counts", "read_attendance", "month_rows", "month_summary",
+                 "month_data", "month_version", "month_columns")
+
+class Storage:
+    # Everything the app persists goes through one of these
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in STORAGE_SPANS:
+            if name in vars(cls):
+                setattr(cls, name, span(f"storage.{name}")(vars(cls)[name]))
+
+    def __init__(self):
+        self.writes = WriteQueue(self.apply_marks)
+        self.listeners = []
+        self.mark_listeners = []
+        self.tables = AttendanceTables()
+
+    def load_students(self):
+        raise NotImplementedError
+
+    def add_student(self, name, cls, rollno):
+        raise NotImplementedError
+
+    def add_students(self, rows):
+        raise NotImplementedError
+
+    def delete_student(self, rollno):
+        raise NotImplementedError
+
+    def delete_students_named(self, name):
+        raise NotImplementedError
+
+    def clear_students(self):
+        raise NotImplementedError
+
+    def save_attendance(self, on_date, rollno, status):
+        self.writes.submit([(on_date, rollno, status)])
+
+    def save_attendance_many(self, marks):
+        self.writes.submit(marks)
+
+    def commit_marks(self, marks):
+        # Apply (Date, RollNo, Status) marks, in order, as one commit; returns the marks stored
+        # (rolls that match no record or student are skipped)
+        raise NotImplementedError
+
+    def apply_marks(self, marks):
+        marks = self.commit_marks(marks)
+        months = {month_of(on_date) for on_date, _, _ in marks} - {None}
+        # The marks are already committed, so a failing listener is logged rather than failing the write
+        for listener in self.listeners:
+            try:
+                listener(months)
+            except Exception:
+                app.logger.exception("on_change listener %r failed", listener)
+        if marks:
+            for listener in self.mark_listeners:
+                try:
+                    listener(marks)
+                except Exception:
+                    app.logger.exception("on_marks listener %r failed", listener)
+
+    def on_change(self, listener):
+        # listener({(year, month), ...}) runs after every committed batch of marks
+        self.listeners.append(listener)
+
+    def on_marks(self, listener):
+        # listener([(Date, RollNo, Status), ...]) runs after every committed batch, after the on_change listeners
+        self.mark_listeners.append(listener)
+
+    def get_attendance(self, on_date, rollno):
+        raise NotImplementedError
+
+    def attendance_on(self, on_date):
+        raise NotImplementedError
+
+    def attendance_for(self, on_date, rollnos):
+        # {RollNo: row} for just these students on `on_date`
+        found = ((roll, self.get_attendance(on_date, roll)) for roll in rollnos)
+        return {roll: r for roll, r in found if r}
+
+    def day_counts(self, on_date, cls=None):
+        # {"Present": n, "Absent": n, "Unclear": n} for `on_date`, optionally in class `cls`
+        counts = {"Present": 0, "Absent": 0, "Unclear": 0}
+        for r in self.attendance_on(on_date).values():
+            if not cls or r["Class"].lower() == cls.lower():
+                counts[status_column(r["Status"])] += 1
+        return counts
+
+    def read_attendance(self):
+        raise NotImplementedError
+
+    def iter_attendance(self, start=None, end=None, cls=None):
+        # Resolved rows with start <= Date <= end (ISO dates, inclusive) in class `cls`, produced lazily
+        raise NotImplementedError
+
+    def month_rows(self, month, year):
+        raise NotImplementedError
+
+    def month_summary(self, month, year):
+        return summarize_month(self.month_rows(month, year))
+
+    def month_data(self, month, year):
+        rows = self.month_rows(month, year)
+        return summarize_month(rows), rows
+
+    def month_version(self, month, year):
+        # Changes whenever that month's attendance changes, in this process or another
+        raise NotImplementedError
+
+    def months(self):
+        # [(year, month), ...] with attendance, oldest first
+        raise NotImplementedError
+
+    def month_columns(self, month, year):
+        # The month's rows as AttendanceRows over self.tables, so any months' columns can be joined
+        return attendance_columns(self.month_rows(month, year), self.tables)
+
+    def find_student(self, rollno):
+        return next((s for s in self.load_students() if s["RollNo"] == rollno), None)
+
+    def student_changes(self, token):
+        # (new token, students, full): the students added since `token`, or the whole roster with full=True
+        # when it changed in any other way. Pass token None to start.
+        return None, self.load_students(), True
+
+index_generations = itertools.count()
+
+class InternTable:
+    # Append-only value <-> number table. Numbers are list positions, so reading values by number needs no lock.
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+        self.lock = threading.Lock()
+
+    def id(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            with self.lock:
+                i = self.ids.get(value)
+                if i is None:
+                    i = len(self.values)
+                    self.values.append(value)
+                    self.ids[value] = i
+        return i
+
+class AttendanceTables:
+    # What the attendance columns of every partition refer to by number: (Name, Class, RollNo) students,
+    # roll numbers, statuses, and dates as day ordinals. Date text other than YYYY-MM-DD gets a negative
+    # number of its own, so it stays distinct just as it is in the files.
+    def __init__(self):
+        self.students = InternTable()
+        self.rolls = InternTable()
+        self.statuses = InternTable()
+        self.day_ids = {}
+        self.day_text = {}
+        self.undated = 0
+        self.lock = threading.Lock()
+
+    def day(self, text):
+        day = self.day_ids.get(text)
+        if day is None:
+            with self.lock:
+                day = self.day_ids.get(text)
+                if day is None:
+                    day = self.iso_day(text)
+                    if day is None:
+                        self.undated += 1
+                        day = -self.undated
+                    self.day_text[day] = text
+                    self.day_ids[text] = day
+        return day
+
+    def find_day(self, text):
+        # Like day(), without remembering text that was never stored
+        day = self.day_ids.get(text)
+        return day if day is not None else self.iso_day(text)
+
+    @staticmethod
+    def iso_day(text):
+        d = day_of(text)
+        return d.toordinal() if d and d.isoformat() == text else None
+
+class AttendanceRows:
+    # Read-only snapshot of a partition's rows that builds each row's dict only when it is read. The columns
+    # are copied (12 bytes a row); the tables are shared, which is safe because they are only ever appended to.
+    def __init__(self, days, sids, codes, tables):
+        self.days = days
+        self.sids = sids
+        self.codes = codes
+        self.tables = tables
+        self.day_text = tables.day_text
+        self.students = tables.students.values
+        self.statuses = tables.statuses.values
+
+    def __len__(self):
+        return len(self.days)
+
+    def __getitem__(self, i):
+        name, cls, rollno = self.students[self.sids[i]]
+        return {"Date": self.day_text[self.days[i]], "Name": name, "Class": cls, "RollNo": rollno,
+                "Status": self.statuses[self.codes[i]]}
+
+    def __iter__(self):
+        day_text, students, statuses = self.day_text, self.students, self.statuses
+        for day, sid, code in zip(self.days, self.sids, self.codes):
+            name, cls, rollno = students[sid]
+            yield {"Date": day_text[day], "Name": name, "Class": cls, "RollNo": rollno, "Status": statuses[code]}
+
+    def tuples(self, cls=None):
+        # (Date, Name, Class, RollNo, Status) for each row, of class `cls` only when given, without any dicts
+        day_text, students, statuses = self.day_text, self.students, self.statuses
+        cls = cls.lower() if cls else None
+        for day, sid, code in zip(self.days, self.sids, self.codes):
+            name, c, rollno = students[sid]
+            if not cls or c.lower() == cls:
+                yield day_text[day], name, c, rollno, statuses[code]
+
+    def __reduce__(self):
+        # Sent to the PDF worker processes as a plain list
+        return list, (list(self),)
+
+def attendance_columns(rows, tables):
+    # AttendanceRows holding attendance dicts, numbered in `tables`
+    days, sids, codes = array("i"), array("i"), array("i")
+    for r in rows:
+        days.append(tables.day(r["Date"]))
+        sids.append(tables.students.id((r["Name"], r["Class"], r["RollNo"])))
+        codes.append(tables.statuses.id(r["Status"]))
+    return AttendanceRows(days, sids, codes, tables)
+
+def join_columns(parts, tables):
+    if len(parts) == 1:
+        return parts[0]
+    days, sids, codes = array("i"), array("i"), array("i")
+    for p in parts:
+        days += p.days
+        sids += p.sids
+        codes += p.codes
+    return AttendanceRows(days, sids, codes, tables)
+
+class AttendancePartition:
+    # One month of the append-only attendance log, resolved and held as columns: row i is day ordinal days[i],
+    # student sids[i] and status codes[i], all numbers from the storage's AttendanceTables. slots[day][roll id]
+    # is the row of that (Date, RollNo), or -1; a later mark overwrites its row in place, so rows stay in the
+    # order they were first written. Per-student and per-day counters are kept alongside. The columns follow
+    # appends by reading only the new tail of the file, and are rebuilt only when the file is replaced.
+    def __init__(self, path, file_lock, tables):
+        self.path = path
+        self.file_lock = file_lock
+        self.tables = tables
+        self.lock = threading.RLock()
+        self.appends_since_compact = 0
+        self.compacting = False
+        self.reset()
+
+    def reset(self):
+        self.stamp = None
+        self.offset = 0
+        self.mark = b""
+        # (rebuild generation, changes since) identifies the resolved contents; compaction leaves it alone
+        self.version = (next(index_generations), 0)
+        # Positions of Date, Name, Class, RollNo and Status in the file's rows
+        self.fields = list(range(len(ATTENDANCE_FIELDS)))
+        self.days = array("i")
+        self.sids = array("i")
+        # Status numbers are unbounded: the files may hold any status text, not just STATUSES
+        self.codes = array("i")
+        self.slots = {}
+        self.counts = {}
+        # {day: {(class, status column): n}} for the dashboard's totals
+        self.day_counts = {}
+
+    def refresh(self):
+        with self.lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                st = None
+            stamp = (st.st_ino, st.st_mtime_ns, st.st_size) if st else None
+            if stamp == self.stamp:
+                return self
+            if not (st and self.stamp and st.st_ino == self.stamp[0] and st.st_size >= self.offset):
+                self.reset()
+            if st:
+                if not self.read_tail():
+                    self.reset()
+                    self.read_tail()
+                # A half-written last line is left for the next refresh
+                self.stamp = (st.st_ino, st.st_mtime_ns, self.offset)
+        return self
+
+    def read_tail(self):
+        # The bytes just before the offset must be the ones seen last time; otherwise the file was
+        # replaced by one that reused the inode number
+        k = len(self.mark)
+        with open(self.path, "rb") as f:
+            f.seek(self.offset - k)
+            data = f.read()
+        if data[:k] != self.mark:
+            return False
+        end = data.rfind(b"\n") + 1
+        if end <= k:
+            return True
+        reader = csv.reader(io.TextIOWrapper(io.BytesIO(data[k:end]), newline=""))
+        if self.offset == 0:
+            header = next(reader, ATTENDANCE_FIELDS)
+            self.fields = [header.index(f) if f in header else len(header) for f in ATTENDANCE_FIELDS]
+        width = max(self.fields) + 1
+        date_i, name_i, class_i, roll_i, status_i = self.fields
+        for r in reader:
+            if not r:
+                continue
+            if len(r) < width:
+                r += [""] * (width - len(r))
+            self.add(r[date_i], r[name_i], r[class_i], r[roll_i], r[status_i])
+        self.offset += end - k
+        self.mark = data[max(0, end - 32):end]
+        scanned("csv", "attendance", 0, len(data))
+        return True
+
+    def add(self, on_date, name, cls, rollno, status):
+        t = self.tables
+        day, rid = t.day(on_date), t.rolls.id(rollno)
+        sid, code = t.students.id((name, cls, rollno)), t.statuses.id(status)
+        slots = self.slots.get(day)
+        if slots is None:
+            slots = self.slots[day] = array("i")
+        if rid >= len(slots):
+            slots.extend(itertools.repeat(-1, rid + 1 - len(slots)))
+        i = slots[rid]
+        if i < 0:
+            slots[rid] = len(self.days)
+            self.days.append(day)
+            self.sids.append(sid)
+            self.codes.append(code)
+            self.version = (self.version[0], self.version[1] + 1)
+            self.count(day, sid, code, 1)
+            return
+        old_sid, old_code = self.sids[i], self.codes[i]
+        if old_code != code:
+            self.version = (self.version[0], self.version[1] + 1)
+        self.sids[i] = sid
+        self.codes[i] = code
+        self.count(day, sid, code, 1)
+        self.count(day, old_sid, old_code, -1)
+
+    def count(self, day, sid, code, n):
+        name, cls, _ = self.tables.students.values[sid]
+        column = status_column(self.tables.statuses.values[code])
+        c = self.counts.get((name, cls))
+        if c is None:
+            c = self.counts[(name, cls)] = {"Name": name, "Class": cls, "Present": 0, "Absent": 0, "Unclear": 0}
+        c[column] += n
+        if c["Present"] + c["Absent"] + c["Unclear"] == 0:
+            del self.counts[(name, cls)]
+        totals = self.day_counts.setdefault(day, {})
+        key = (cls.lower(), column)
+        totals[key] = totals.get(key, 0) + n
+
+    def row(self, i):
+        t = self.tables
+        name, cls, rollno = t.students.values[self.sids[i]]
+        return {"Date": t.day_text[self.days[i]], "Name": name, "Class": cls, "RollNo": rollno,
+                "Status": t.statuses.values[self.codes[i]]}
+
+    def rows_on(self, on_date, rollnos=None):
+        # Row numbers on `on_date`, in file order, of everyone or just `rollnos`
+        slots = self.slots.get(self.tables.find_day(on_date))
+        if not slots:
+            return []
+        if rollnos is None:
+            return sorted(i for i in slots if i >= 0)
+        rids = (self.tables.rolls.ids.get(roll) for roll in rollnos)
+        return sorted(slots[rid] for rid in rids if rid is not None and rid < len(slots) and slots[rid] >= 0)
+
+    def get(self, on_date, rollno):
+        with self.lock:
+            found = self.refresh().rows_on(on_date, [rollno])
+            return self.row(found[0]) if found else None
+
+    def on_date(self, on_date, rollnos=None):
+        with self.lock:
+            found = {}
+            for i in self.refresh().rows_on(on_date, rollnos):
+                r = self.row(i)
+                found[r["RollNo"]] = r
+        scanned("csv", "attendance", len(found))
+        return found
+
+    def for_students(self, on_date, rollnos):
+        return self.on_date(on_date, rollnos)
+
+    def totals_on(self, on_date, cls=None):
+        counts = {"Present": 0, "Absent": 0, "Unclear": 0}
+        with self.lock:
+            for (c, status), n in self.refresh().day_counts.get(self.tables.find_day(on_date), {}).items():
+                if not cls or c == cls.lower():
+                    counts[status] += n
+        return counts
+
+    def records(self):
+        with self.lock:
+            rows = AttendanceRows(array("i", self.refresh().days), array("i", self.sids), array("i", self.codes), self.tables)
+        scanned("csv", "attendance", len(rows))
+        return rows
+
+    def snapshot(self):
+        with self.lock:
+            self.refresh()
+            summary = {k: dict(v) for k, v in self.counts.items()}
+            rows = AttendanceRows(array("i", self.days), array("i", self.sids), array("i", self.codes), self.tables)
+        scanned("csv", "attendance", len(rows))
+        return summary, rows
+
+    def append(self, rows):
+        with self.file_lock, self.lock:
+            new = not os.path.exists(self.path)
+            append_durably(self.path, csv_text(rows, ATTENDANCE_FIELDS, header=new))
+            self.refresh()
+            self.appends_since_compact += len(rows)
+            due = self.appends_since_compact >= COMPACT_EVERY and not self.compacting
+        if due:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        with self.lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        try:
+            # Fold the log as of now without blocking markers, then carry over whatever was appended meanwhile.
+            # The old file stays open throughout so its inode number cannot be reused by another compaction.
+            with open(self.path, "rb") as f, AtomicWriter(self.path) as out:
+                head = f.read()
+                # An append may be in flight; leave its partial line to the tail
+                head = head[:head.rfind(b"\n") + 1]
+                rows = resolve_attendance(io.TextIOWrapper(io.BytesIO(head), newline=""))
+                out.file.write(csv_text(rows, ATTENDANCE_FIELDS, header=True))
+                with self.file_lock, self.lock:
+                    if os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino:
+                        # Another process compacted first
+                        out.discard()
+                        return
+                    f.seek(len(head))
+                    tail = f.read()
+                    f.close()
+                    out.file.write(tail.decode(out.file.encoding))
+                    current = self.stamp is not None and self.offset == len(head) + len(tail)
+                    out.commit()
+                    # Compaction does not change the resolved rows, so a current index stays valid
+                    if current:
+                        with open(self.path, "rb") as new:
+                            st = os.fstat(new.fileno())
+                            new.seek(max(0, st.st_size - 32))
+                            self.mark = new.read()
+                        self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+                        self.offset = st.st_size
+                    self.appends_since_compact = tail.count(b"\n")
+        finally:
+            self.compacting = False
+
+class CSVStorage(Storage):
+    def __init__(self, students_file, attendance_dir, legacy_file=None):
+        super().__init__()
+        self.students_file = students_file
+        self.attendance_dir = attendance_dir
+        # Every process writing these files takes this lock, so workers never interleave or lose writes
+        self.file_lock = FileLock(attendance_dir + ".lock")
+        with self.file_lock:
+            if not os.path.exists(students_file):
+                self.write_students([])
+            if not os.path.isdir(attendance_dir):
+                self.migrate(legacy_file)
+        self.partitions = {}
+        self.partitions_lock = threading.Lock()
+
+    def migrate(self, legacy_file):
+        # Split the old single attendance.csv into monthly partitions. The new directory only appears
+        # once it is complete, so an interrupted migration simply runs again.
+        tmp = self.attendance_dir + ".tmp"
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        rows = []
+        if legacy_file and os.path.exists(legacy_file):
+            with open(legacy_file, newline="") as f:
+                rows = resolve_attendance(f)
+        parts = {}
+        for r in rows:
+            parts.setdefault(self.partition_name(r["Date"]), []).append(r)
+        for name, part in parts.items():
+            with AtomicWriter(os.path.join(tmp, name + ".csv")) as out:
+                out.file.write(csv_text(part, ATTENDANCE_FIELDS, header=True))
+        os.replace(tmp, self.attendance_dir)
+        if rows:
+            os.replace(legacy_file, legacy_file + ".migrated")
+
+    @staticmethod
+    def partition_name(on_date):
+        return month_key(on_date) or "undated"
+
+    def partition(self, name):
+        with self.partitions_lock:
+            p = self.partitions.get(name)
+            if p is None:
+                p = self.partitions[name] = AttendancePartition(os.path.join(self.attendance_dir, name + ".csv"), self.file_lock, self.tables)
+            return p
+
+    def partition_for(self, on_date):
+        return self.partition(self.partition_name(on_date))
+
+    # Students
+    def load_students(self):
+        with open(self.students_file, newline="") as f:
+            students = list(csv.DictReader(f))
+            size = os.fstat(f.fileno()).st_size
+        scanned("csv", "students", len(students), size)
+        return students
+
+    def write_students(self, students):
+        with self.file_lock, AtomicWriter(self.students_file) as out:
+            out.file.write(csv_text(students, STUDENT_FIELDS, header=True))
+
+    def add_student(self, name, cls, rollno):
+        self.add_students([[name, cls, rollno]])
+
+    def add_students(self, rows):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        with self.file_lock:
+            append_durably(self.students_file, buf.getvalue())
+
+    def delete_student(self, rollno):
+        with self.file_lock:
+            self.write_students([s for s in self.load_students() if s["RollNo"] != rollno])
+
+    def student_changes(self, token):
+        # students.csv only grows between rewrites, and rewrites replace the file, so new students are the
+        # tail after the last offset seen. token = (inode, offset, last 32 bytes before the offset).
+        with open(self.students_file, "rb") as f:
+            ino = os.fstat(f.fileno()).st_ino
+            if token and token[0] == ino:
+                offset, mark = token[1], token[2]
+                f.seek(offset - len(mark))
+                data = f.read()
+                if data[:len(mark)] == mark:
+                    end = data.rfind(b"\n") + 1
+                    if end <= len(mark):
+                        return token, [], False
+                    text = io.TextIOWrapper(io.BytesIO(data[len(mark):end]), newline="")
+                    students = list(csv.DictReader(text, fieldnames=STUDENT_FIELDS))
+                    scanned("csv", "students", len(students), len(data))
+                    return (ino, offset + end - len(mark), data[max(0, end - 32):end]), students, False
+                f.seek(0)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        text = io.TextIOWrapper(io.BytesIO(data[:end]), newline="")
+        students = list(csv.DictReader(text))
+        scanned("csv", "students", len(students), len(data))
+        return (ino, end, data[max(0, end - 32):end]), students, True
+
+    def delete_students_named(self, name):
+        with self.file_lock:
+            self.write_students([s for s in self.load_students() if s["Name"].lower() != name.lower()])
+
+    def clear_students(self):
+        self.write_students([])
+
+    # Attendance
+    def commit_marks(self, marks):
+        roster = None
+        parts = {}
+        committed = []
+        with self.file_lock:
+            for on_date, rollno, status in marks:
+                part = self.partition_for(on_date)
+                pending = parts.setdefault(part, {})
+                # Re-marking keeps the record's Name/Class, which also lets deleted students be re-marked
+                existing = pending.get((on_date, rollno)) or part.get(on_date, rollno)
+                if not existing:
+                    if roster is None:
+                        roster = {}
+                        for s in self.load_students():
+                            roster.setdefault(s["RollNo"], s)
+                    existing = roster.get(rollno)
+                if not existing:
+                    continue
+                pending[(on_date, rollno)] = {"Date": on_date, "Name": existing["Name"], "Class": existing["Class"],
+                                              "RollNo": rollno, "Status": status}
+                committed.append((on_date, rollno, status))
+            for part, rows in parts.items():
+                if rows:
+                    part.append(list(rows.values()))
+        return committed
+
+    def get_attendance(self, on_date, rollno):
+        return self.partition_for(on_date).get(on_date, rollno)
+
+    def attendance_on(self, on_date):
+        return self.partition_for(on_date).on_date(on_date)
+
+    def attendance_for(self, on_date, rollnos):
+        return self.partition_for(on_date).for_students(on_date, rollnos)
+
+    def day_counts(self, on_date, cls=None):
+        return self.partition_for(on_date).totals_on(on_date, cls)
+
+    def partition_names(self):
+        return sorted(f[:-4] for f in os.listdir(self.attendance_dir) if f.endswith(".csv"))
+
+    def read_attendance(self):
+        return list(self.iter_attendance())
+
+    def iter_attendance(self, start=None, end=None, cls=None):
+        first, last = day_of(start) if start else None, day_of(end) if end else None
+        cls = cls.lower() if cls else None
+        for name in self.partition_names():
+            ym = month_of(name + "-01")
+            if (first or last) and not ym:
+                continue
+            if ym:
+                lo, hi = (day_of(d) for d in month_bounds(ym[1], ym[0]))
+                if (first and hi < first) or (last and lo > last):
+                    continue
+                # Only the months at the edges of the range need a per-row date check
+                whole = (not first or first <= lo) and (not last or hi <= last)
+            for r in self.partition(name).records():
+                if not (first or last) or whole or (first or date.min) <= (day_of(r["Date"]) or date.min) <= (last or date.max):
+                    if not cls or r["Class"].lower() == cls:
+                        yield r
+
+    def month_rows(self, month, year):
+        return self.month_data(month, year)[1]
+
+    def month_summary(self, month, year):
+        return self.month_data(month, year)[0]
+
+    def month_data(self, month, year):
+        return self.partition(f"{year:04d}-{month:02d}").snapshot()
+
+    def month_version(self, month, year):
+        return self.partition(f"{year:04d}-{month:02d}").refresh().version
+
+    def months(self):
+        return sorted(ym for ym in (month_of(name + "-01") for name in self.partition_names()) if ym)
+
+    def month_columns(self, month, year):
+        return self.partition(f"{year:04d}-{month:02d}").records()
+
+class SQLiteStorage(Storage):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.local = threading.local()
+        # AttendanceRows per month; reading a month back out of the database is the slow part
+        self.columns = ReportCache(REPORT_CACHE_SIZE)
+        with self.db as db:
+            db.executescript("""
+                CREATE TABLE IF NOT EXISTS students (
+                    Name TEXT NOT NULL, Class TEXT NOT NULL, RollNo TEXT NOT NULL);
+                CREATE INDEX IF NOT EXISTS students_rollno ON students (RollNo);
+                CREATE INDEX IF NOT EXISTS students_class ON students (Class);
+                CREATE TABLE IF NOT EXISTS attendance (
+                    Date TEXT NOT NULL, Name TEXT NOT NULL, Class TEXT NOT NULL,
+                    RollNo TEXT NOT NULL, Status TEXT NOT NULL, Month TEXT,
+                    PRIMARY KEY (Date, RollNo));
+                CREATE INDEX IF NOT EXISTS attendance_month ON attendance (Month);
+                CREATE INDEX IF NOT EXISTS attendance_class ON attendance (Class COLLATE NOCASE);
+                CREATE TABLE IF NOT EXISTS month_counts (
+                    Month TEXT NOT NULL, Name TEXT NOT NULL, Class TEXT NOT NULL,
+                    Present INTEGER NOT NULL DEFAULT 0, Absent INTEGER NOT NULL DEFAULT 0, Unclear INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (Month, Name, Class));
+                CREATE TABLE IF NOT EXISTS month_versions (
+                    Month TEXT PRIMARY KEY, Version INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS student_deletes (Version INTEGER NOT NULL);
+                INSERT INTO student_deletes SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM student_deletes);
+                CREATE TRIGGER IF NOT EXISTS students_deleted AFTER DELETE ON students
+                    BEGIN UPDATE student_deletes SET Version = Version + 1; END;
+            """)
+            if not db.execute("SELECT 1 FROM month_counts LIMIT 1").fetchone():
+                self.rebuild_month_counts(db)
+
+    @property
+    def db(self):
+        # sqlite3 connections are per thread
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    # Students
+    def load_students(self):
+        students = [dict(r) for r in self.db.execute("SELECT Name, Class, RollNo FROM students ORDER BY rowid")]
+        scanned("sqlite", "students", len(students))
+        return students
+
+    def add_student(self, name, cls, rollno):
+        self.add_students([[name, cls, rollno]])
+
+    def add_students(self, rows):
+        with self.db as db:
+            db.executemany("INSERT INTO students (Name, Class, RollNo) VALUES (?, ?, ?)", [r[:3] for r in rows if len(r) >= 3])
+
+    def delete_student(self, rollno):
+        with self.db as db:
+            db.execute("DELETE FROM students WHERE RollNo = ?", (rollno,))
+
+    def delete_students_named(self, name):
+        with self.db as db:
+            db.execute("DELETE FROM students WHERE lower(Name) = ?", (name.lower(),))
+
+    def clear_students(self):
+        with self.db as db:
+            db.execute("DELETE FROM students")
+
+    def student_changes(self, token):
+        # Inserts only ever raise the rowid; anything else bumps student_deletes.
+        # token = (student_deletes version, highest rowid seen)
+        deletes = self.db.execute("SELECT Version FROM student_deletes").fetchone()[0]
+        full = not token or token[0] != deletes
+        since = 0 if full else token[1]
+        rows = self.db.execute("SELECT rowid, Name, Class, RollNo FROM students WHERE rowid > ? ORDER BY rowid", (since,)).fetchall()
+        token = (deletes, rows[-1]["rowid"] if rows else since)
+        scanned("sqlite", "students", len(rows))
+        return token, [{"Name": r["Name"], "Class": r["Class"], "RollNo": r["RollNo"]} for r in rows], full
+
+    def find_student(self, rollno):
+        r = self.db.execute("SELECT Name, Class, RollNo FROM students WHERE RollNo = ? ORDER BY rowid LIMIT 1", (rollno,)).fetchone()
+        return dict(r) if r else None
+
+    # Attendance
+    def commit_marks(self, marks):
+        with self.db as db:
+            return [m for m in marks if self.mark(db, *m)]
+
+    def mark(self, db, on_date, rollno, status):
+        month = month_key(on_date)
+        old = db.execute("SELECT Name, Class, Status FROM attendance WHERE Date = ? AND RollNo = ?", (on_date, rollno)).fetchone()
+        if old:
+            name, cls = old["Name"], old["Class"]
+            db.execute("UPDATE attendance SET Status = ? WHERE Date = ? AND RollNo = ?", (status, on_date, rollno))
+        else:
+            student = self.find_student(rollno)
+            if not student:
+                return False
+            name, cls = student["Name"], student["Class"]
+            db.execute("INSERT INTO attendance (Date, Name, Class, RollNo, Status, Month) VALUES (?, ?, ?, ?, ?, ?)",
+                       (on_date, name, cls, rollno, status, month))
+        if month:
+            if old:
+                self.bump(db, month, name, cls, old["Status"], -1)
+            self.bump(db, month, name, cls, status, 1)
+            db.execute("INSERT INTO month_versions (Month, Version) VALUES (?, 1) "
+                       "ON CONFLICT (Month) DO UPDATE SET Version = Version + 1", (month,))
+        return True
+
+    @staticmethod
+    def bump(db, month, name, cls, status, n):
+        col = status_column(status)
+        db.execute("INSERT INTO month_counts (Month, Name, Class) VALUES (?, ?, ?) ON CONFLICT DO NOTHING", (month, name, cls))
+        db.execute(f"UPDATE month_counts SET {col} = {col} + ? WHERE Month = ? AND Name = ? AND Class = ?", (n, month, name, cls))
+
+    @staticmethod
+    def rebuild_month_counts(db):
+        db.execute("DELETE FROM month_counts")
+        db.execute("""
+            INSERT INTO month_counts (Month, Name, Class, Present, Absent, Unclear)
+            SELECT Month, Name, Class, SUM(Status = 'Present'), SUM(Status = 'Absent'), SUM(Status NOT IN ('Present', 'Absent'))
+            FROM attendance WHERE Month IS NOT NULL GROUP BY Month, Name, Class ORDER BY MIN(rowid)
+        """)
+        db.execute("UPDATE month_versions SET Version = Version + 1")
+        db.execute("INSERT OR IGNORE INTO month_versions (Month, Version) SELECT DISTINCT Month, 1 FROM attendance WHERE Month IS NOT NULL")
+
+    def get_attendance(self, on_date, rollno):
+        r = self.db.execute(
+            "SELECT Date, Name, Class, RollNo, Status FROM attendance WHERE Date = ? AND RollNo = ?", (on_date, rollno)).fetchone()
+        return dict(r) if r else None
+
+    def attendance_on(self, on_date):
+        rows = self.db.execute(
+            "SELECT Date, Name, Class, RollNo, Status FROM attendance WHERE Date = ? ORDER BY rowid", (on_date,))
+        found = {r["RollNo"]: dict(r) for r in rows}
+        scanned("sqlite", "attendance", len(found))
+        return found
+
+    def attendance_for(self, on_date, rollnos):
+        found = {}
+        rollnos = list(rollnos)
+        for i in range(0, len(rollnos), 500):
+            part = rollnos[i:i + 500]
+            rows = self.db.execute(
+                f"SELECT Date, Name, Class, RollNo, Status FROM attendance WHERE Date = ? AND RollNo IN ({','.join('?' * len(part))})",
+                [on_date] + part)
+            found.update((r["RollNo"], dict(r)) for r in rows)
+        scanned("sqlite", "attendance", len(found))
+        return found
+
+    def day_counts(self, on_date, cls=None):
+        sql, args = "SELECT Status, COUNT(*) FROM attendance WHERE Date = ?", [on_date]
+        if cls:
+            sql += " AND Class = ? COLLATE NOCASE"
+            args.append(cls)
+        counts = {"Present": 0, "Absent": 0, "Unclear": 0}
+        for status, n in self.db.execute(sql + " GROUP BY Status", args):
+            counts[status_column(status)] += n
+        return counts
+
+    def read_attendance(self):
+        rows = [dict(r) for r in self.db.execute("SELECT Date, Name, Class, RollNo, Status FROM attendance ORDER BY rowid")]
+        scanned("sqlite", "attendance", len(rows))
+        return rows
+
+    def iter_attendance(self, start=None, end=None, cls=None):
+        where, args = [], []
+        if start or end:
+            # Undated rows fall outside every range, as the CSV backend skips its "undated" partition
+            where.append("Month IS NOT NULL")
+        if start:
+            where.append("Date >= ?")
+            args.append(start)
+        if end:
+            where.append("Date <= ?")
+            args.append(end)
+        if cls:
+            where.append("Class = ? COLLATE NOCASE")
+            args.append(cls)
+        sql = "SELECT Date, Name, Class, RollNo, Status FROM attendance"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        n = 0
+        try:
+            for n, r in enumerate(self.db.execute(sql + " ORDER BY Month IS NULL, Month, rowid", args), 1):
+                yield dict(r)
+        finally:
+            scanned("sqlite", "attendance", n)
+
+    def month_rows(self, month, year):
+        rows = self.db.execute(
+            "SELECT Date, Name, Class, RollNo, Status FROM attendance WHERE Month = ? ORDER BY rowid", (f"{year:04d}-{month:02d}",))
+        rows = [dict(r) for r in rows]
+        scanned("sqlite", "attendance", len(rows))
+        return rows
+
+    def month_summary(self, month, year):
+        rows = self.db.execute(
+            "SELECT Name, Class, Present, Absent, Unclear FROM month_counts WHERE Month = ? AND Present + Absent + Unclear > 0 ORDER BY rowid",
+            (f"{year:04d}-{month:02d}",))
+        summary = {(r["Name"], r["Class"]): dict(r) for r in rows}
+        scanned("sqlite", "month_counts", len(summary))
+        return summary
+
+    def month_version(self, month, year):
+        r = self.db.execute("SELECT Version FROM month_versions WHERE Month = ?", (f"{year:04d}-{month:02d}",)).fetchone()
+        return r["Version"] if r else 0
+
+    def month_data(self, month, year):
+        with self.db:
+            return self.month_summary(month, year), self.month_rows(month, year)
+
+    def months(self):
+        # Every month ever written to; one left empty by a re-import just has no columns
+        rows = self.db.execute("SELECT Month FROM month_versions ORDER BY Month")
+        return [(int(r["Month"][:4]), int(r["Month"][5:])) for r in rows]
+
+    def month_columns(self, month, year):
+        key, version = ("columns", month, year), self.month_version(month, year)
+        rows = self.columns.get(key, version)
+        if rows is None:
+            rows = super().month_columns(month, year)
+            self.columns.put(key, version, rows)
+        return rows
+
+    def import_csv(self, students_file, attendance_dir, legacy_file=None):
+        # One-shot import; replaces whatever the database held
+        source = CSVStorage(students_file, attendance_dir, legacy_file)
+        students = source.load_students()
+        attendance = source.read_attendance()
+        with self.db as db:
+            db.execute("DELETE FROM students")
+            db.execute("DELETE FROM attendance")
+            db.executemany("INSERT INTO students (Name, Class, RollNo) VALUES (?, ?, ?)",
+                           [(s["Name"], s["Class"], s["RollNo"]) for s in students])
+            db.executemany("INSERT INTO attendance (Date, Name, Class, RollNo, Status, Month) VALUES (?, ?, ?, ?, ?, ?)",
+                           [(r["Date"], r["Name"], r["Class"], r["RollNo"], r["Status"], month_key(r["Date"])) for r in attendance])
+            self.rebuild_month_counts(db)
+        return len(students), len(attendance)
+
+def make_storage():
+    if STORAGE_BACKEND == "sqlite":
+        fresh = not os.path.exists(SQLITE_FILE)
+        backend = SQLiteStorage(SQLITE_FILE)
+        if fresh and os.path.exists(STUDENTS_FILE):
+            backend.import_csv(STUDENTS_FILE, ATTENDANCE_DIR, ATTENDANCE_FILE)
+        return backend
+    return CSVStorage(STUDENTS_FILE, ATTENDANCE_DIR, ATTENDANCE_FILE)
+
+storage = make_storage()
+
+@app.cli.command("import-csv")
+def import_csv_command():
+    """Copy students.csv and the attendance CSVs into the SQLite database."""
+    students, attendance = SQLiteStorage(SQLITE_FILE).import_csv(STUDENTS_FILE, ATTENDANCE_DIR, ATTENDANCE_FILE)
+    print(f"Imported {students} students and {attendance} attendance records into {SQLITE_FILE}")
+
+report_cache = ReportCache(REPORT_CACHE_SIZE)
+storage.on_change(report_cache.invalidate)
+
+def cached_report(kind, month, year, build, *filters):
+    # Cached values are shared between requests and must not be modified
+    version = storage.month_version(month, year)
+    key = (kind, month, year) + filters
+    value = report_cache.get(key, version)
+    if value is None:
+        value = span(f"aggregate.{kind}")(build)()
+        report_cache.put(key, version, value)
+    return value
+
+# ----------------- STUDENT INDEX -----------------
+# Closest-match threshold (difflib ratio) for names the speech recognizer got slightly wrong
+NAME_MATCH_CUTOFF = float(os.environ.get("NAME_MATCH_CUTOFF", "0.75"))
+NAME_MATCH_CANDIDATES = 8
+
+def name_grams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class StudentIndex:
+    # The roster in file order, per class, and by case-folded Name, plus a trigram index over the distinct
+    # names for fuzzy lookups. It follows the roster through storage.student_changes(): new students are
+    # added in place, and only a delete (or a rewrite by another process) rebuilds it.
+    def __init__(self, storage):
+        self.storage = storage
+        self.lock = threading.RLock()
+        self.token = None
+        self.reset()
+
+    def reset(self):
+        self.roster = []
+        self.by_roll = {}
+        self.by_class = {}
+        self.class_names = {}
+        self.by_name = {}
+        self.grams = {}
+
+    def refresh(self):
+        with self.lock:
+            token, students, full = self.storage.student_changes(self.token)
+            if full:
+                self.reset()
+            for s in students:
+                self.roster.append(s)
+                self.by_roll.setdefault(s.get("RollNo"), s)
+                cls = (s.get("Class") or "").lower()
+                self.by_class.setdefault(cls, []).append(s)
+                self.class_names.setdefault(cls, s.get("Class") or "")
+                if not s.get("Name"):
+                    continue
+                key = s["Name"].casefold()
+                found = self.by_name.get(key)
+                if found is None:
+                    found = self.by_name[key] = {}
+                    for g in name_grams(key):
+                        self.grams.setdefault(g, set()).add(key)
+                found.setdefault(s["RollNo"], s)
+            self.token = token
+        return self
+
+    def exact(self, name):
+        # Students called `name`, in roster order
+        with self.lock:
+            return list(self.refresh().by_name.get(name.casefold(), {}).values())
+
+    def closest(self, name):
+        # Students with the best-matching name above NAME_MATCH_CUTOFF; empty when there is none or it is a tie
+        key = name.casefold()
+        with self.lock:
+            self.refresh()
+            hits = {}
+            for g in name_grams(key):
+                for other in self.grams.get(g, ()):
+                    hits[other] = hits.get(other, 0) + 1
+            candidates = heapq.nlargest(NAME_MATCH_CANDIDATES, hits, key=hits.get)
+            scored = sorted(((difflib.SequenceMatcher(None, key, c).ratio(), c) for c in candidates), reverse=True)
+            if not scored or scored[0][0] < NAME_MATCH_CUTOFF or (len(scored) > 1 and scored[1][0] == scored[0][0]):
+                return []
+            return list(self.by_name[scored[0][1]].values())
+
+    def lookup(self, name):
+        # First student called `name`, falling back to the closest name
+        found = self.exact(name) or self.closest(name)
+        return found[0] if found else None
+
+    def find(self, rollno):
+        with self.lock:
+            return self.refresh().by_roll.get(rollno)
+
+    def page(self, cls, offset, limit):
+        # (students[offset:offset + limit], total) of class `cls`, or of everyone when it is empty
+        with self.lock:
+            self.refresh()
+            students = self.by_class.get(cls.lower(), []) if cls else self.roster
+            return students[offset:offset + limit], len(students)
+
+    def classes(self):
+        # [(class, number of students)], sorted by class
+        with self.lock:
+            self.refresh()
+            return sorted((self.class_names[c], len(s)) for c, s in self.by_class.items() if c)
+
+student_index = StudentIndex(storage)
 
 # ----------------- UTILITIES -----------------
 def load_students():
-    with open(STUDENTS_FILE, newline="") as f:
-        return list(csv.DictReader(f))
+    return storage.load_students()
+
+def read_attendance():
+    return storage.read_attendance()
 
 def save_attendance(on_date, rollno, status):
-    rows = []
-    with open(ATTENDANCE_FILE, newline="") as f:
-        reader = csv.DictReader(f)
-        rows = list(reader)
+    storage.save_attendance(on_date, rollno, status)
 
-    updated = False
-    for r in rows:
-        if r["Date"] == on_date and r["RollNo"] == rollno:
-            r["Status"] = status
-            updated = True
-
-    if not updated:
-        for s in load_students():
-            if s["RollNo"] == rollno:
-                rows.append({
-                    "Date": on_date, "Name": s["Name"], "Class": s["Class"],
-                    "RollNo": s["RollNo"], "Status": status
-                })
-
-    with open(ATTENDANCE_FILE, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["Date", "Name", "Class", "RollNo", "Status"])
-        writer.writeheader()
-        writer.writerows(rows)
+def save_attendance_many(marks):
+    # [(Date, RollNo, Status), ...] applied as one commit
+    storage.save_attendance_many(marks)
+
+def class_marks(on_date, cls, status, exceptions=(), except_status="Absent"):
+    # Everyone in `cls` (or in every class when it is empty) gets `status`; students listed in `exceptions` (by roll number or name) get
+    # `except_status`, or are left alone when it is empty
+    exceptions = {e.strip().lower() for e in exceptions if e.strip()}
+    marks = []
+    for s in load_students():
+        if cls and s["Class"].lower() != cls.lower():
+            continue
+        if s["RollNo"].lower() in exceptions or s["Name"].lower() in exceptions:
+            if except_status:
+                marks.append((on_date, s["RollNo"], except_status))
+        else:
+            marks.append((on_date, s["RollNo"], status))
+    return marks
 
 def load_attendance(on_date):
+    return day_records(on_date, load_students(), storage.attendance_on(on_date))
+
+def day_records(on_date, students, marked):
     data = []
-    students = load_students()
-    with open(ATTENDANCE_FILE, newline="") as f:
-        rows = list(csv.DictReader(f))
     for s in students:
-        found = [r for r in rows if r["Date"] == on_date and r["RollNo"] == s["RollNo"]]
-        if found:
-            data.append(found[0])
+        r = marked.get(s["RollNo"])
+        if r:
+            data.append(r)
         else:
             data.append({"Date": on_date, "Name": s["Name"], "Class": s["Class"], "RollNo": s["RollNo"], "Status": "Not Marked"})
     return data
 
 def get_month_report(month, year):
-    report = {}
-    with open(ATTENDANCE_FILE, newline="") as f:
-        for r in csv.DictReader(f):
-            try:
-                d = datetime.strptime(r["Date"], "%Y-%m-%d")
-            except:
-                continue
-            if d.month == month and d.year == year:
-                key = (r["Name"], r["Class"])
-                if key not in report:
-                    report[key] = {"Name": r["Name"], "Class": r["Class"], "Present": 0, "Absent": 0, "Unclear": 0}
-                if r["Status"] == "Present":
-                    report[key]["Present"] += 1
-                elif r["Status"] == "Absent":
-                    report[key]["Absent"] += 1
-                else:
-                    report[key]["Unclear"] += 1
-    return report
+    return cached_report("summary", month, year, lambda: storage.month_summary(month, year))
 
 def get_month_details(month, year):
-    details = []
-    with open(ATTENDANCE_FILE, newline="") as f:
-        for r in csv.DictReader(f):
-            try:
-                d = datetime.strptime(r["Date"], "%Y-%m-%d")
-            except:
-                continue
-            if d.month == month and d.year == year:
-                details.append(r)
-    return details
+    return get_month_data(month, year)[1]
+
+def get_month_data(month, year):
+    # Summary and details together, from one consistent read
+    return cached_report("data", month, year, lambda: storage.month_data(month, year))
 
 def parse_month_year_from_query():
     today = date.today()
     month = request.args.get("month", type=int) or today.month
     year = request.args.get("year", type=int) or today.year
+    if not 1 <= month <= 12 or not 1 <= year <= 9999:
+        abort(400, "month must be 1-12 and year 1-9999")
     return month, year
 
+def parse_export_query():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD for a date range, otherwise ?month=&year=; optional ?class=
+    start, end = request.args.get("start") or None, request.args.get("end") or None
+    cls = request.args.get("class") or None
+    month = None
+    if start or end:
+        if (start and not day_of(start)) or (end and not day_of(end)):
+            abort(400, "start and end must be YYYY-MM-DD dates")
+        title = f"{start or 'beginning'} to {end or 'latest'}"
+        stem = f"attendance_{start or 'start'}_{end or 'end'}"
+    else:
+        month, year = parse_month_year_from_query()
+        start, end = month_bounds(month, year)
+        month = (month, year)
+        title = datetime(year, month[0], 1).strftime("%B %Y")
+        stem = f"attendance_{year}_{month[0]:02d}"
+    if cls:
+        title += f" - Class {cls}"
+        stem += f"_{secure_filename(cls)}"
+    return start, end, cls, month, title, stem
+
+def export_summary(start, end, cls, month=None):
+    # Whole months come straight from the maintained counters; other ranges go through the aggregator
+    if month:
+        summary = get_month_report(*month).values()
+        return [r for r in summary if not cls or r["Class"].lower() == cls.lower()]
+    return rollup(("student",), start, end, cls)
+
+def cache_chunks(chunks, key, version):
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    report_cache.put(key, version, b"".join(parts))
+
+def record_tuples(rows, cls=None):
+    # (Date, Name, Class, RollNo, Status) for each record, of class `cls` only when given
+    if isinstance(rows, AttendanceRows):
+        return rows.tuples(cls)
+    cls = cls.lower() if cls else None
+    return ((r["Date"], r["Name"], r["Class"], r["RollNo"], r["Status"]) for r in rows if not cls or r["Class"].lower() == cls)
+
+def csv_export_chunks(title, summary, records, chunk_size=64 * 1024):
+    # records: record_tuples()
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(["Summary for", title])
+    writer.writerow(["Name", "Class", "Present", "Absent", "Unclear"])
+    for r in summary:
+        writer.writerow([r["Name"], r["Class"], r["Present"], r["Absent"], r["Unclear"]])
+    writer.writerow([])
+    writer.writerow(["Detailed Records"])
+    writer.writerow(["Date", "Name", "Class", "RollNo", "Status"])
+    for d in records:
+        writer.writerow(d)
+        if buf.tell() >= chunk_size:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+# ----------------- ANALYTICS -----------------
+# Attendance rolled up by any mix of student, class, month and term, with attendance percentages. The
+# "numpy" engine answers a rollup with a few whole-array passes over the attendance columns; "python" (the
+# default without NumPy) makes one pass in Python. Both give the same rows in the same order.
+AGGREGATION_ENGINE = os.environ.get("AGGREGATION_ENGINE", "numpy" if np else "python").lower()
+# "Name:MM-DD:MM-DD" terms separated by ";". A term may run past December ("Term 2:10-01:03-31"), and then
+# belongs to the year it starts in.
+ATTENDANCE_TERMS = os.environ.get("ATTENDANCE_TERMS", "Term 1:01-01:04-30;Term 2:05-01:08-31;Term 3:09-01:12-31")
+ROLLUP_DIMENSIONS = ("student", "class", "month", "term")
+
+def parse_terms(spec):
+    terms = []
+    for part in filter(str.strip, spec.split(";")):
+        name, start, end = part.rsplit(":", 2)
+        terms.append((name.strip(), tuple(map(int, start.split("-"))), tuple(map(int, end.split("-")))))
+    return terms
+
+TERMS = parse_terms(ATTENDANCE_TERMS)
+
+def term_of(d):
+    md = (d.month, d.day)
+    for name, start, end in TERMS:
+        if start <= end and start <= md <= end:
+            return f"{d.year} {name}"
+        if start > end and (md >= start or md <= end):
+            return f"{d.year if md >= start else d.year - 1} {name}"
+    return None
+
+def rollup_labels(rows, by, lo, hi, cls):
+    # What each student id, and each day number, adds to a row's group as (field, value) pairs; None leaves
+    # the row out (another class, outside lo..hi or outside every term). The day function is None when no
+    # range or grouping needs the date; otherwise dates that cannot be read are left out.
+    cls = cls.lower() if cls else None
+    sid_labels = []
+    for name, c, _ in rows.students:
+        pairs = ()
+        for dim in by:
+            if dim == "student":
+                pairs += (("Name", name), ("Class", c))
+            elif dim == "class":
+                pairs += (("Class", c),)
+        sid_labels.append(None if cls and c.lower() != cls else pairs)
+    if lo is None and hi is None and "month" not in by and "term" not in by:
+        return sid_labels, None
+
+    def day_label(day):
+        if day < 0:
+            # Readable dates written some other way (2025-9-3) still belong to their day
+            d = day_of(rows.day_text[day])
+            if d is None:
+                return None
+            day = d.toordinal()
+        if (lo is not None and day < lo) or (hi is not None and day > hi):
+            return None
+        d = date.fromordinal(day)
+        pairs = ()
+        for dim in by:
+            if dim == "month":
+                pairs += (("Month", f"{d.year:04d}-{d.month:02d}"),)
+            elif dim == "term":
+                term = term_of(d)
+                if term is None:
+                    return None
+                pairs += (("Term", term),)
+        return pairs
+    return sid_labels, day_label
+
+def number_labels(labels):
+    # (distinct labels, each label's number), where None gets the number after the last label
+    keys, index = [], {}
+    for label in labels:
+        if label is not None and label not in index:
+            index[label] = len(keys)
+            keys.append(label)
+    return keys, [len(keys) if label is None else index[label] for label in labels]
+
+class PythonAggregator:
+    name = "python"
+
+    def rollup(self, rows, by, lo=None, hi=None, cls=None):
+        # [(label pairs, [Present, Absent, Unclear]), ...] in order of each group's first row
+        sid_labels, day_label = rollup_labels(rows, by, lo, hi, cls)
+        columns = [STATUSES.index(status_column(s)) for s in rows.statuses]
+        day_labels, groups = {}, {}
+        for day, sid, code in zip(rows.days, rows.sids, rows.codes):
+            s = sid_labels[sid]
+            if s is None:
+                continue
+            if day_label is None:
+                d = ()
+            else:
+                d = day_labels.get(day, False)
+                if d is False:
+                    d = day_labels[day] = day_label(day)
+                if d is None:
+                    continue
+            counts = groups.get((s, d))
+            if counts is None:
+                counts = groups[(s, d)] = [0, 0, 0]
+            counts[columns[code]] += 1
+        return [(s + d, counts) for (s, d), counts in groups.items()]
+
+class NumpyAggregator:
+    name = "numpy"
+
+    def rollup(self, rows, by, lo=None, hi=None, cls=None):
+        # Same result as PythonAggregator. Each row gets one group number, (student label, day label) in
+        # mixed radix, where rows left out land in groups with the spare label; one bincount over
+        # group * statuses + status code then counts everything.
+        if not len(rows):
+            return []
+        sid_labels, day_label = rollup_labels(rows, by, lo, hi, cls)
+        s_keys, s_ids = number_labels(sid_labels)
+        statuses = list(rows.statuses)
+        d_keys, d_ids = [()], None
+        if day_label is not None:
+            known = tuple(rows.day_text)
+            d_keys, d_ids = number_labels([day_label(d) for d in known])
+            d_ids = dict(zip(known, d_ids))
+        radix = len(d_keys) + 1 if d_ids is not None else 1
+        size = (len(s_keys) + 1) * radix
+        group = np.asarray(s_ids, dtype=np.int64)[np.frombuffer(rows.sids, dtype=np.intc)]
+        if d_ids is not None:
+            group *= radix
+            group += self.day_groups(np.frombuffer(rows.days, dtype=np.intc), d_ids, len(d_keys))
+        codes = np.frombuffer(rows.codes, dtype=np.intc)
+        if len(statuses) > len(STATUSES):
+            # Other status text counts as Unclear; fold it first so the count table stays three wide
+            codes = np.asarray([STATUSES.index(status_column(s)) for s in statuses], dtype=np.int64)[codes]
+            statuses = list(STATUSES)
+        by_code = np.bincount(group * len(statuses) + codes, minlength=size * len(statuses)).reshape(size, len(statuses))
+        first = np.full(size, len(group), dtype=np.int64)
+        np.minimum.at(first, group, np.arange(len(group), dtype=np.int64))
+        found = np.flatnonzero(first < len(group))
+        found = found[np.argsort(first[found], kind="stable")]
+        counts = np.zeros((len(found), 3), dtype=np.int64)
+        for code, status in enumerate(statuses):
+            counts[:, STATUSES.index(status_column(status))] += by_code[found, code]
+        result = []
+        spare_s, spare_d = len(s_keys), len(d_keys)
+        for g, c in zip(found.tolist(), counts.tolist()):
+            s, d = divmod(g, radix)
+            if s != spare_s and d != spare_d:
+                result.append((s_keys[s] + d_keys[d], c))
+        return result
+
+    @staticmethod
+    def day_groups(days, d_ids, spare):
+        # Day label number of every row, looked up by ordinal; other date text (negative numbers) is rare
+        dated = [d for d in d_ids if d >= 0]
+        base = min(dated, default=0)
+        lut = np.full(max(dated, default=0) - base + 1, spare, dtype=np.int64)
+        for d in dated:
+            lut[d - base] = d_ids[d]
+        labels = lut[np.clip(days - base, 0, len(lut) - 1)]
+        undated = [d for d in d_ids if d < 0]
+        if undated:
+            other = np.zeros(1 - min(undated), dtype=np.int64)
+            for d in undated:
+                other[-d] = d_ids[d]
+            labels = np.where(days >= 0, labels, other[np.clip(-days, 0, len(other) - 1)])
+        return labels
+
+aggregator = NumpyAggregator() if AGGREGATION_ENGINE == "numpy" and np is not None else PythonAggregator()
+
+def range_columns(start=None, end=None):
+    # Columns of every month overlapping start..end (ISO dates, inclusive; None leaves that end open)
+    first, last = month_of(start) if start else None, month_of(end) if end else None
+    months = [ym for ym in storage.months() if (not first or ym >= first) and (not last or ym <= last)]
+    return join_columns([storage.month_columns(m, y) for y, m in months], storage.tables) if months else None
+
+@span("aggregate.rollup")
+def rollup(by, start=None, end=None, cls=None):
+    # [{"Name", "Class", "Month", "Term" (those grouped by), "Present", "Absent", "Unclear", "Records",
+    # "Percentage"}, ...] for rows with start <= Date <= end in class `cls`
+    rows = range_columns(start, end)
+    if rows is None:
+        return []
+    lo, hi = (day_of(d).toordinal() if d else None for d in (start, end))
+    result = []
+    for labels, (present, absent, unclear) in aggregator.rollup(rows, tuple(by), lo, hi, cls):
+        total = present + absent + unclear
+        result.append(dict(labels, Present=present, Absent=absent, Unclear=unclear, Records=total,
+                           Percentage=round(100 * present / total, 1)))
+    return result
+
+def attendance_rankings(start=None, end=None, cls=None, lowest=False, min_records=1):
+    # Students by share of records marked Present, best first (or worst first); equal shares share a rank
+    students = [r for r in rollup(("student",), start, end, cls) if r["Records"] >= min_records]
+    students.sort(key=lambda r: ((1 if lowest else -1) * r["Present"] / r["Records"], -r["Records"], r["Name"]))
+    previous = None
+    for i, r in enumerate(students, 1):
+        share = r["Present"] / r["Records"]
+        if share != previous:
+            rank, previous = i, share
+        r["Rank"] = rank
+    return students
+
 # ----------------- NLP COMMAND HANDLER -----------------
+# Commands are registered in priority order and merged into one compiled pattern: each alternative is an
+# anchored lookahead, so a single match() finds the first command that occurs anywhere in the query.
+NLPParse = namedtuple("NLPParse", "command args")
+NLP_COMMANDS = {}
+_nlp_grammar = None
+
+def register_nlp_command(name, pattern):
+    def register(handler):
+        global _nlp_grammar
+        NLP_COMMANDS[name] = (pattern, handler)
+        _nlp_grammar = None
+        return handler
+    return register
+
+def nlp_grammar():
+    global _nlp_grammar
+    if _nlp_grammar is None:
+        alternatives = []
+        for name, (pattern, _) in NLP_COMMANDS.items():
+            pattern = re.sub(r"\(\?P<(\w+)>", rf"(?P<{name}__\1>", pattern)
+            alternatives.append(f"(?=.*?(?P<{name}>{pattern}))")
+        _nlp_grammar = re.compile("|".join(alternatives), re.DOTALL)
+    return _nlp_grammar
+
+def parse_nlp_command(query):
+    match = nlp_grammar().match(query.lower())
+    if not match:
+        return None
+    command = match.lastgroup
+    prefix = command + "__"
+    args = {k[len(prefix):]: v for k, v in match.groupdict().items() if k.startswith(prefix)}
+    return NLPParse(command, args)
+
+@span("nlp.command")
 def process_nlp_command(query):
-    query = query.lower()
+    parsed = parse_nlp_command(query)
+    if not parsed:
+        return False, "❌ Sorry, I could not understand your command"
+    return NLP_COMMANDS[parsed.command][1](**parsed.args)
 
-    # Add Student
-    match = re.search(r"add student (\w+) class (\w+) roll (\d+)", query)
-    if match:
-        name, cls, roll = match.groups()
-        with open(STUDENTS_FILE, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([name.capitalize(), cls.upper(), roll])
-        return False, f"✅ Student {name} added successfully (via NLP)!"
-
-    # Mark Attendance
-    match = re.search(r"mark (\w+) (present|absent|unclear)", query)
-    if match:
-        name, status = match.groups()
-        today = str(date.today())
-        students = load_students()
-        roll = None
-        for s in students:
-            if s["Name"].lower() == name.lower():
-                roll = s["RollNo"]
-                break
-        if roll:
-            save_attendance(today, roll, status.capitalize())
-            return False, f"✅ Attendance marked for {name} ({status}) via NLP!"
+@register_nlp_command("add_student", r"add student (?P<name>\w+) class (?P<cls>\w+) roll (?P<roll>\d+)")
+def nlp_add_student(name, cls, roll):
+    storage.add_student(name.capitalize(), cls.upper(), roll)
+    return False, f"✅ Student {name} added successfully (via NLP)!"
+
+def nlp_names(text):
+    # "alice bob, carol and dave" -> ["alice", "bob", "carol", "dave"]
+    return [n for n in re.split(r"[\s,]+", text) if n and n != "and"]
+
+def nlp_students(names):
+    # The student each name refers to, and the names that match nobody
+    found, missing = [], []
+    for n in names:
+        student = student_index.lookup(n)
+        if student:
+            found.append(student)
         else:
-            return False, f"❌ Student {name} not found"
+            missing.append(n)
+    return found, missing
 
-    # Show Report
-    match = re.search(r"show report for (\w+)", query)
-    if match:
-        month_name = match.group(1).capitalize()
-        try:
-            month_num = datetime.strptime(month_name, "%B").month
-            today = date.today()
-            report = get_month_report(month_num, today.year)
-            details = get_month_details(month_num, today.year)
-            return True, render_template_string(MONTH_TEMPLATE, report=report, details=details, month=month_name, month_num=month_num, year=today.year)
-        except:
-            return False, "❌ Could not understand month in report query"
-    
-    # New NLP features
-    if query == "show students":
-        students = load_students()
-        if not students:
-            return False, "❌ No students found."
-        html_list = f"""
-        <h3>All Students:</h3>
-        <div class="search-container">
-            <input type="text" id="studentSearch" placeholder="Search for students..." onkeyup="filterStudents()">
-            <span class="search-icon">🔍</span>
-        </div>
-        <ul id="studentList">
-        """
-        for s in students:
-            html_list += f"<li>{s['Name']} (Class: {s['Class']}, Roll: {s['RollNo']})</li>"
-        html_list += """
-        </ul>
-        <script>
-        function filterStudents() {
-            const input = document.getElementById('studentSearch');
-            const filter = input.value.toLowerCase();
-            const ul = document.getElementById('studentList');
-            const li = ul.getElementsByTagName('li');
-            for (let i = 0; i < li.length; i++) {
-                const text = li[i].textContent || li[i].innerText;
-                if (text.toLowerCase().indexOf(filter) > -1) {
-                    li[i].style.display = "";
-                } else {
-                    li[i].style.display = "none";
-                }
+NLP_STATUS = r"present|absent|unclear"
+NLP_OPPOSITE = {"present": "Absent", "absent": "Present"}
+
+@register_nlp_command("mark_class", rf"mark (?:all|everyone)(?: of)?(?: class (?P<cls>\w+))? (?P<status>{NLP_STATUS})(?: except (?P<exceptions>[\w ,]+))?")
+def nlp_mark_class(cls, status, exceptions):
+    # Unclear has no opposite, so its exceptions are left unmarked
+    excluded, missing = nlp_students(nlp_names(exceptions or ""))
+    if missing:
+        return False, f"❌ Student {', '.join(missing)} not found"
+    marks = class_marks(str(date.today()), cls, status.capitalize(), [s["RollNo"] for s in excluded], NLP_OPPOSITE.get(status, ""))
+    if not marks:
+        return False, f"❌ No students found in class {cls.upper()}" if cls else "❌ No students found."
+    save_attendance_many(marks)
+    who = f"class {cls.upper()}" if cls else "all students"
+    if excluded:
+        who += " except " + ", ".join(s["Name"] for s in excluded)
+    return False, f"✅ Attendance marked for {who} ({status}) via NLP!"
+
+@register_nlp_command("mark", rf"mark (?P<groups>[\w ,]+? (?:{NLP_STATUS})(?:(?:,? and |, ?| )[\w ,]+? (?:{NLP_STATUS}))*)\b")
+def nlp_mark(groups):
+    # "mark alice bob and carol present, dave absent" is written as one batch
+    today = str(date.today())
+    marks, marked, missing = [], [], []
+    for names, status in re.findall(rf"([\w ,]+?) ({NLP_STATUS})\b", groups):
+        students, not_found = nlp_students(nlp_names(names))
+        missing.extend(not_found)
+        for student in students:
+            marks.append((today, student["RollNo"], status.capitalize()))
+        if students:
+            marked.append(f"{', '.join(s['Name'] for s in students)} ({status})")
+    if marks:
+        save_attendance_many(marks)
+    if len(marks) == 1 and not missing:
+        return False, f"✅ Attendance marked for {marked[0]} via NLP!"
+    if not marks and len(missing) == 1:
+        return False, f"❌ Student {missing[0]} not found"
+    message = f"✅ Attendance marked for {', '.join(marked)} via NLP!" if marks else ""
+    if missing:
+        message += f" ❌ Not found: {', '.join(missing)}"
+    return False, message.strip()
+
+@register_nlp_command("show_report", r"show report for (?P<month>\w+)")
+def nlp_show_report(month):
+    month_name = month.capitalize()
+    try:
+        month_num = datetime.strptime(month_name, "%B").month
+    except ValueError:
+        return False, "❌ Could not understand month in report query"
+    today = date.today()
+    report, details = get_month_data(month_num, today.year)
+    return True, render_template("month.html", report=report, details=record_tuples(details), month=month_name, month_num=month_num, year=today.year)
+
+@register_nlp_command("show_students", r"^show students\Z")
+def nlp_show_students():
+    students = load_students()
+    if not students:
+        return False, "❌ No students found."
+    html_list = f"""
+    <h3>All Students:</h3>
+    <div class="search-container">
+        <input type="text" id="studentSearch" placeholder="Search for students..." onkeyup="filterStudents()">
+        <span class="search-icon">🔍</span>
+    </div>
+    <ul id="studentList">
+    """
+    for s in students:
+        html_list += f"<li>{s['Name']} (Class: {s['Class']}, Roll: {s['RollNo']})</li>"
+    html_list += """
+    </ul>
+    <script>
+    function filterStudents() {
+        const input = document.getElementById('studentSearch');
+        const filter = input.value.toLowerCase();
+        const ul = document.getElementById('studentList');
+        const li = ul.getElementsByTagName('li');
+        for (let i = 0; i < li.length; i++) {
+            const text = li[i].textContent || li[i].innerText;
+            if (text.toLowerCase().indexOf(filter) > -1) {
+                li[i].style.display = "";
+            } else {
+                li[i].style.display = "none";
             }
         }
-        </script>
-        """
-        return True, html_list
+    }
+    </script>
+    """
+    return True, html_list
 
-    match = re.search(r" (\d{4}-\d{2}-\d{2})", query)
-    if match:
-        date_str = match.group(1)
-        records = load_attendance(date_str)
-        html_table = f"<h3>Attendance for {date_str}:</h3><table><thead><tr><th>Name</th><th>Status</th></tr></thead><tbody>"
-        for r in records:
-            html_table += f"<tr><td>{r['Name']}</td><td>{r['Status']}</td></tr>"
-        html_table += "</tbody></table>"
-        return True, html_table
-
-    match = re.search(r"delete student (\w+)", query)
-    if match:
-        name = match.group(1)
-        students = load_students()
-        student_to_delete = next((s for s in students if s['Name'].lower() == name.lower()), None)
-        if student_to_delete:
-            new_students = [s for s in students if s["Name"].lower() != name.lower()]
-            with open(STUDENTS_FILE, "w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["Name", "Class", "RollNo"])
-                writer.writeheader()
-                writer.writerows(new_students)
-            return False, f"🗑️ Student {name} deleted successfully via NLP!"
-        else:
-            return False, f"❌ Student {name} not found."
-    
-    # New command to remove all students
-    if query == "remove all students":
-        with open(STUDENTS_FILE, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Name", "Class", "RollNo"])
-        return False, "🗑️ All students have been removed."
-
-    match = re.search(r"add class (\w+)", query)
+@register_nlp_command("show_date", r" (?P<date_str>\d{4}-\d{2}-\d{2})")
+def nlp_show_date(date_str):
+    records = load_attendance(date_str)
+    html_table = f"<h3>Attendance for {date_str}:</h3><table><thead><tr><th>Name</th><th>Status</th></tr></thead><tbody>"
+    for r in records:
+        html_table += f"<tr><td>{r['Name']}</td><td>{r['Status']}</td></tr>"
+    html_table += "</tbody></table>"
+    return True, html_table
+
+@register_nlp_command("delete_student", r"delete student (?P<name>\w+)")
+def nlp_delete_student(name):
+    # Deleting never guesses; a near miss is only suggested
+    if student_index.exact(name):
+        storage.delete_students_named(name)
+        return False, f"🗑️ Student {name} deleted successfully via NLP!"
+    match = student_index.closest(name)
     if match:
-        file_path = match.group(1) + ".csv"
-        if not os.path.exists(file_path):
-            return False, f"❌ CSV file '{file_path}' not found."
-        with open(file_path, newline="") as f:
-            reader = csv.reader(f)
-            new_students = list(reader)
-        with open(STUDENTS_FILE, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerows(new_students)
-        return False, f"✅ Students from class '{match.group(1)}' added successfully!"
-
-    return False, "❌ Sorry, I could not understand your command"
+        return False, f"❌ Student {name} not found. Did you mean {match[0]['Name']}?"
+    return False, f"❌ Student {name} not found."
+
+@register_nlp_command("remove_all_students", r"^remove all students\Z")
+def nlp_remove_all_students():
+    storage.clear_students()
+    return False, "🗑️ All students have been removed."
+
+@register_nlp_command("add_class", r"add class (?P<cls>\w+)")
+def nlp_add_class(cls):
+    file_path = cls + ".csv"
+    if not os.path.exists(file_path):
+        return False, f"❌ CSV file '{file_path}' not found."
+    with open(file_path, newline="") as f:
+        reader = csv.reader(f)
+        new_students = list(reader)
+    storage.add_students(new_students)
+    return False, f"✅ Students from class '{cls}' added successfully!"
+
+# ----------------- PDF -----------------
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+# Build PDFs in this many worker processes instead of the pdf threads; 0 keeps them in-process
+PDF_PROCESSES = int(os.environ.get("PDF_PROCESSES", "0"))
+# How long a request waits for a PDF before answering 202 and letting the browser retry
+PDF_WAIT_SECONDS = float(os.environ.get("PDF_WAIT_SECONDS", "10"))
+# Detail rows per table; small tables split across pages cheaply, one huge table does not
+PDF_CHUNK_ROWS = 45
+SUMMARY_COL_WIDTHS = [170, 80, 60, 60, 60]
+DETAIL_COL_WIDTHS = [75, 150, 70, 70, 75]
+
+SUMMARY_STYLE = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#2563eb")),
+    ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+    ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
+    ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#eef2ff")]),
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("FONTSIZE", (0,0), (-1,-1), 9),
+    ("ALIGN", (2,1), (-1,-1), "CENTER"),
+])
+DETAIL_STYLE = TableStyle([
+    ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#16a34a")),
+    ("TEXTCOLOR", (0,0), (-1,0), colors.white),
+    ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
+    ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#ecfdf5")]),
+    ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
+    ("FONTSIZE", (0,0), (-1,-1), 9),
+])
+PDF_STYLES = getSampleStyleSheet()
+
+PDF_PENDING_PAGE = """<!doctype html><html><head><meta http-equiv="refresh" content="2"><title>Preparing PDF</title></head>
+<body style="font-family:sans-serif;text-align:center;margin-top:20vh">⏳ Preparing your PDF report&hellip;</body></html>"""
+
+pdf_executor = ThreadPoolExecutor(max_workers=PDF_WORKERS, thread_name_prefix="pdf")
+pdf_jobs = {}
+pdf_jobs_lock = threading.Lock()
+pdf_processes = None
+
+def chunked_tables(header, rows, col_widths, style, size=PDF_CHUNK_ROWS):
+    # Fixed column widths spare ReportLab from measuring every cell
+    for i in range(0, len(rows), size):
+        tbl = Table([header] + rows[i:i + size], colWidths=col_widths, repeatRows=1)
+        tbl.setStyle(style)
+        yield tbl
+
+@span("pdf.build")
+def build_report_pdf(title, summary, details):
+    mem = io.BytesIO()
+    doc = SimpleDocTemplate(mem, pagesize=A4)
+    elems = [Paragraph(f"<b>{title}</b>", PDF_STYLES["Title"]), Spacer(1, 12)]
+
+    summary_rows = [[r["Name"], r["Class"], r["Present"], r["Absent"], r["Unclear"]] for r in summary]
+    elems.append(Paragraph("<b>Summary</b>", PDF_STYLES["Heading2"]))
+    elems.extend(chunked_tables(["Name", "Class", "Present", "Absent", "Unclear"], summary_rows, SUMMARY_COL_WIDTHS, SUMMARY_STYLE))
+    elems.append(Spacer(1, 18))
+
+    detail_rows = list(record_tuples(details))
+    elems.append(Paragraph("<b>Detailed Records</b>", PDF_STYLES["Heading2"]))
+    elems.extend(chunked_tables(["Date", "Name", "Class", "RollNo", "Status"], detail_rows, DETAIL_COL_WIDTHS, DETAIL_STYLE))
+
+    doc.build(elems)
+    return mem.getvalue()
+
+@span("pdf.render")
+def render_month_pdf(month, year):
+    global pdf_processes
+    report, details = get_month_data(month, year)
+    title = f"Attendance Report - {datetime(year, month, 1).strftime('%B %Y')}"
+    if not PDF_PROCESSES:
+        return build_report_pdf(title, list(report.values()), details)
+    # The pdf thread only gathers the data and then waits, without the GIL, for a worker process
+    with pdf_jobs_lock:
+        if pdf_processes is None:
+            # Workers come from a forkserver (spawn where there is none), never forked from this process:
+            # a child forked while another thread holds a lock, like the metrics lock, hangs on it for good
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+            pdf_processes = ProcessPoolExecutor(max_workers=PDF_PROCESSES, mp_context=context)
+    return pdf_processes.submit(build_report_pdf, title, list(report.values()), details).result()
+
+def month_pdf_job(month, year):
+    # One render per (month, year, data version): finished PDFs live in the report cache and
+    # concurrent requests share the job in flight
+    key, version = ("pdf", month, year), storage.month_version(month, year)
+    pdf = report_cache.get(key, version)
+    if pdf is not None:
+        job = Future()
+        job.set_result(pdf)
+        return job
+    with pdf_jobs_lock:
+        job = pdf_jobs.get((month, year, version))
+        new = job is None
+        if new:
+            job = pdf_jobs[(month, year, version)] = pdf_executor.submit(contextvars.copy_context().run, render_month_pdf, month, year)
+    if new:
+        job.add_done_callback(lambda done: finish_pdf_job(key, version, done))
+    return job
+
+def finish_pdf_job(key, version, job):
+    with pdf_jobs_lock:
+        pdf_jobs.pop((key[1], key[2], version), None)
+    if not job.exception():
+        report_cache.put(key, version, job.result())
+
+# ----------------- VOICE -----------------
+# "google" (default, online), "offline" (CMU Sphinx, needs pocketsphinx) or "stub" (tests)
+VOICE_ENGINE = os.environ.get("VOICE_ENGINE", "google").lower()
+VOICE_WORKERS = int(os.environ.get("VOICE_WORKERS", "4"))
+# Finished jobs are forgotten after this many seconds
+VOICE_JOB_TTL = 600
+# Longest a status poll may hold its request with ?wait=
+VOICE_MAX_WAIT = 30
+# Uploaded audio is cut into phrases at pauses, with the same defaults as speech_recognition's Recognizer
+VOICE_ENERGY_THRESHOLD = int(os.environ.get("VOICE_ENERGY_THRESHOLD", "300"))
+VOICE_PAUSE_SECONDS = 0.8
+VOICE_MAX_PHRASE_SECONDS = 15
+# Decodes WebM/Ogg/MP4 uploads; WAV is read directly
+FFMPEG = os.environ.get("FFMPEG", "ffmpeg")
+
+microphone_lock = threading.Lock()
+
+class SpeechEngine:
+    # Turns audio into text. Jobs either bring their own audio (an uploaded WAV/AIFF/FLAC file) or
+    # listen on the server's microphone, which has to be taken in turns.
+    def listen(self):
+        with microphone_lock, sr.Microphone() as source:
+            return sr.Recognizer().listen(source, timeout=5, phrase_time_limit=5)
+
+    def load(self, data):
+        with sr.AudioFile(io.BytesIO(data)) as source:
+            return sr.Recognizer().record(source)
+
+    def recognize(self, audio):
+        raise NotImplementedError
+
+class GoogleEngine(SpeechEngine):
+    def recognize(self, audio):
+        return sr.Recognizer().recognize_google(audio)
+
+class OfflineEngine(SpeechEngine):
+    def recognize(self, audio):
+        return sr.Recognizer().recognize_sphinx(audio)
+
+class StubEngine(SpeechEngine):
+    # Hears VOICE_STUB_TEXT every time, without a microphone or network
+    def __init__(self, text=None):
+        self.text = text or os.environ.get("VOICE_STUB_TEXT", "show students")
+
+    def listen(self):
+        return None
+
+    def load(self, data):
+        return None
+
+    def recognize(self, audio):
+        return self.text
+
+VOICE_ENGINES = {"google": GoogleEngine, "offline": OfflineEngine, "sphinx": OfflineEngine, "stub": StubEngine}
+
+speech_engine = VOICE_ENGINES.get(VOICE_ENGINE, GoogleEngine)()
+voice_executor = ThreadPoolExecutor(max_workers=VOICE_WORKERS, thread_name_prefix="voice")
+voice_jobs = {}
+voice_jobs_lock = threading.Lock()
+
+@span("voice.command")
+def recognize_command(audio_data=None):
+    audio = speech_engine.load(audio_data) if audio_data is not None else speech_engine.listen()
+    return speech_engine.recognize(audio).lower()
+
+def prune_voice_jobs(now):
+    # Forget finished jobs after VOICE_JOB_TTL; call with voice_jobs_lock held
+    for old in [k for k, (at, job) in voice_jobs.items() if job.done() and now - at > VOICE_JOB_TTL]:
+        del voice_jobs[old]
+
+def submit_voice_job(audio_data=None):
+    job_id = uuid.uuid4().hex
+    now = time.monotonic()
+    with voice_jobs_lock:
+        prune_voice_jobs(now)
+        voice_jobs[job_id] = (now, voice_executor.submit(contextvars.copy_context().run, recognize_command, audio_data))
+    return job_id
+
+@span("voice.phrase")
+def recognize_phrase(pcm, rate, width):
+    try:
+        return speech_engine.recognize(sr.AudioData(pcm, rate, width))
+    except sr.UnknownValueError:
+        return ""
+
+class PhraseSegmenter:
+    # Splits PCM at pauses and hands each finished phrase to on_phrase(pcm, rate, width), so phrases are
+    # recognized while the rest of the clip is still arriving. Only 16-bit audio is split; anything else
+    # becomes a single phrase when the upload ends.
+    FRAME_SECONDS = 0.03
+
+    def __init__(self, on_phrase):
+        self.on_phrase = on_phrase
+        self.rate, self.width = 16000, 2
+        self.pending = bytearray()
+        self.phrase = bytearray()
+        self.voiced = False
+        self.quiet = 0
+
+    def set_format(self, rate, width):
+        self.rate, self.width = rate, width
+
+    def feed(self, pcm):
+        if self.width != 2:
+            self.phrase += pcm
+            return
+        self.pending += pcm
+        frame = int(self.rate * self.FRAME_SECONDS) * 2
+        pad = int(self.rate * 0.3) * 2
+        while len(self.pending) >= frame:
+            chunk = self.pending[:frame]
+            del self.pending[:frame]
+            samples = array("h", chunk)
+            loud = sum(x * x for x in samples) > VOICE_ENERGY_THRESHOLD ** 2 * len(samples)
+            self.phrase += chunk
+            if loud:
+                self.voiced, self.quiet = True, 0
+            elif self.voiced:
+                self.quiet += 1
+            elif len(self.phrase) > pad:
+                # Keep a little lead-in before speech starts
+                del self.phrase[:-pad]
+            if self.voiced and (self.quiet * self.FRAME_SECONDS >= VOICE_PAUSE_SECONDS
+                                or len(self.phrase) >= self.rate * 2 * VOICE_MAX_PHRASE_SECONDS):
+                self.emit()
+
+    def emit(self):
+        if self.voiced or (self.width != 2 and self.phrase):
+            self.on_phrase(bytes(self.phrase), self.rate, self.width)
+        self.phrase = bytearray()
+        self.voiced, self.quiet = False, 0
+
+    def close(self):
+        self.phrase += self.pending
+        self.pending = bytearray()
+        self.emit()
+
+class WavDecoder:
+    # Reads the RIFF header as it arrives, then passes the first channel's samples on
+    def __init__(self, segmenter):
+        self.segmenter = segmenter
+        self.head = bytearray()
+        self.fmt = None
+        self.rest = b""
+
+    def feed(self, data):
+        if self.head is not None:
+            self.head += data
+            data = self.read_header()
+            if data is None:
+                return
+        data = self.rest + data
+        channels, width = self.fmt
+        n = len(data) - len(data) % (channels * width)
+        frames, self.rest = data[:n], data[n:]
+        if channels > 1:
+            frames = array("h", frames)[::channels].tobytes() if width == 2 else \
+                b"".join(frames[i:i + width] for i in range(0, n, channels * width))
+        self.segmenter.feed(frames)
+
+    def read_header(self):
+        head = self.head
+        if len(head) >= 12 and (head[:4] != b"RIFF" or head[8:12] != b"WAVE"):
+            raise ValueError("not a WAV file")
+        pos = 12
+        while len(head) >= pos + 8:
+            chunk_id, size = head[pos:pos + 4], struct.unpack("<I", head[pos + 4:pos + 8])[0]
+            if chunk_id == b"data":
+                if self.fmt is None:
+                    raise ValueError("WAV file has no format chunk")
+                self.head = None
+                return bytes(head[pos + 8:])
+            if len(head) < pos + 8 + size:
+                return None
+            if chunk_id == b"fmt ":
+                tag, channels, rate, _, _, bits = struct.unpack("<HHIIHH", head[pos + 8:pos + 24])
+                if tag not in (1, 0xFFFE):
+                    raise ValueError("only PCM WAV files are supported")
+                self.fmt = (channels, bits // 8)
+                self.segmenter.set_format(rate, bits // 8)
+            pos += 8 + size + size % 2
+        return None
+
+    def close(self):
+        self.segmenter.close()
+
+    def abort(self):
+        pass
+
+class FFmpegDecoder:
+    # Pipes compressed audio through ffmpeg into 16 kHz mono PCM; a reader thread keeps its output drained
+    def __init__(self, segmenter):
+        self.segmenter = segmenter
+        segmenter.set_format(16000, 2)
+        self.proc = subprocess.Popen([FFMPEG, "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", "16000", "pipe:1"],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        self.reader = threading.Thread(target=self.pump, daemon=True)
+        self.reader.start()
+
+    def pump(self):
+        while True:
+            pcm = self.proc.stdout.read1(65536)
+            if not pcm:
+                break
+            self.segmenter.feed(pcm)
+
+    def feed(self, data):
+        try:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+        except BrokenPipeError:
+            raise ValueError("could not decode the audio")
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.reader.join()
+        self.proc.wait()
+        self.segmenter.close()
+
+    def abort(self):
+        self.proc.kill()
+
+class VoiceStream:
+    # One upload in progress. Each phrase goes to the voice pool as soon as it ends; the transcript future
+    # resolves once the upload is finished and every phrase is recognized.
+    def __init__(self, fmt):
+        self.lock = threading.Lock()
+        self.phrases = []
+        self.transcript = Future()
+        self.touched = time.monotonic()
+        segmenter = PhraseSegmenter(self.add_phrase)
+        self.decoder = WavDecoder(segmenter) if fmt == "wav" else FFmpegDecoder(segmenter)
+
+    def add_phrase(self, pcm, rate, width):
+        self.phrases.append(voice_executor.submit(recognize_phrase, pcm, rate, width))
+
+    def feed(self, data):
+        with self.lock:
+            self.touched = time.monotonic()
+            self.decoder.feed(data)
+
+    def finish(self):
+        with self.lock:
+            self.decoder.close()
+            phrases = list(self.phrases)
+        left = [len(phrases)]
+        def done(_):
+            with self.lock:
+                left[0] -= 1
+                if left[0]:
+                    return
+            try:
+                text = " ".join(t for t in (p.result() for p in phrases) if t).lower()
+            except Exception as e:
+                self.transcript.set_exception(e)
+                return
+            if text:
+                self.transcript.set_result(text)
+            else:
+                self.transcript.set_exception(ValueError("could not understand the audio"))
+        if not phrases:
+            left[0] = 1
+            done(None)
+        for p in phrases:
+            p.add_done_callback(done)
+
+    def abort(self, error):
+        self.decoder.abort()
+        if not self.transcript.done():
+            self.transcript.set_exception(error)
+
+voice_streams = {}
+
+def open_voice_stream(fmt):
+    job_id = uuid.uuid4().hex
+    stream = VoiceStream(fmt)
+    now = time.monotonic()
+    with voice_jobs_lock:
+        for old in [k for k, s in voice_streams.items() if now - s.touched > VOICE_JOB_TTL]:
+            voice_streams.pop(old).abort(TimeoutError("upload abandoned"))
+        prune_voice_jobs(now)
+        voice_streams[job_id] = stream
+        voice_jobs[job_id] = (now, stream.transcript)
+    return job_id, stream
+
+def voice_stream(job_id, kind):
+    # (job_id, stream): a new stream when job_id is None, else the open one (None if unknown).
+    # Raises OSError when `kind` of audio needs ffmpeg and it is missing.
+    if job_id is None:
+        return open_voice_stream("wav" if "wav" in kind else "compressed")
+    with voice_jobs_lock:
+        return job_id, voice_streams.get(job_id)
+
+def close_voice_stream(job_id, error=None):
+    with voice_jobs_lock:
+        stream = voice_streams.pop(job_id, None)
+    if stream is None:
+        return
+    if error is None:
+        stream.finish()
+    else:
+        stream.abort(error)
+
+def voice_job_status(job_id, wait=0):
+    with voice_jobs_lock:
+        entry = voice_jobs.get(job_id)
+    if entry is None:
+        return None
+    job = entry[1]
+    try:
+        text = job.result(timeout=min(wait, VOICE_MAX_WAIT))
+    except FutureTimeout:
+        return {"job": job_id, "status": "pending"}
+    except Exception as e:
+        return {"job": job_id, "status": "error", "error": f"❌ Voice NLP error: {e}"}
+    return {"job": job_id, "status": "done", "text": text}
+
+# ----------------- LIVE UPDATES -----------------
+# Recent events kept for clients that reconnect (EventSource sends Last-Event-ID)
+EVENT_BUFFER_SIZE = 1024
+# Idle connections get a comment this often, so dead ones are noticed and proxies keep them open
+SSE_HEARTBEAT_SECONDS = 15
+
+class EventHub:
+    # In-process pub/sub over a ring buffer. Publishing appends one pre-serialized event and wakes the
+    # waiting subscribers; each subscriber only remembers the last id it sent, so a publish costs the same
+    # for one connection or hundreds, and slow clients never hold anything up.
+    def __init__(self, size):
+        self.events = deque(maxlen=size)
+        self.last_id = 0
+        self.cond = threading.Condition()
+        self.watchers = []
+
+    def publish(self, kind, data):
+        payload = json.dumps(data, separators=(",", ":"))
+        with self.cond:
+            self.last_id += 1
+            self.events.append((self.last_id, kind, payload))
+            self.cond.notify_all()
+        for watcher in self.watchers:
+            watcher()
+
+    def watch(self, callback):
+        # callback() runs after every publish, for subscribers that cannot block on the condition (asgi.py)
+        self.watchers.append(callback)
+
+    def wait(self, after, timeout):
+        # Events newer than `after` (empty on timeout), or None when some of them have left the buffer
+        with self.cond:
+            self.cond.wait_for(lambda: self.last_id != after, timeout)
+            first = self.last_id - len(self.events) + 1
+            if after > self.last_id or after + 1 < first:
+                return None
+            return list(itertools.islice(self.events, after + 1 - first, None))
+
+event_hub = EventHub(EVENT_BUFFER_SIZE)
+
+def publish_marks(marks):
+    # One "marks" event per committed batch: the changed records, plus each affected day's totals for
+    # everyone ("") and for every class touched, so dashboards can apply it without asking again
+    days = {}
+    for on_date, rollno, status in marks:
+        s = student_index.find(rollno) or {}
+        days.setdefault(on_date, {})[rollno] = {"Date": on_date, "Name": s.get("Name", ""), "Class": s.get("Class", ""),
+                                               "RollNo": rollno, "Status": status}
+    for on_date, records in days.items():
+        classes = {r["Class"].lower() for r in records.values()} | {""}
+        event_hub.publish("marks", {"date": on_date, "records": list(records.values()),
+                                    "counts": {c: day_totals(on_date, c) for c in classes}})
+
+storage.on_marks(publish_marks)
+
+def sse_start(last_id):
+    # Where a subscriber starts: after its Last-Event-ID, or after the newest event for a new one
+    return int(last_id) if last_id and last_id.isdigit() else event_hub.last_id
+
+def sse_chunk(after, events):
+    # (new position, text to send) for what event_hub.wait() returned
+    if events is None:
+        # Too far behind to catch up from the buffer; the page reloads instead
+        after = event_hub.last_id
+        return after, f"id: {after}\nevent: reset\ndata: {{}}\n\n"
+    if events:
+        return events[-1][0], "".join(f"id: {i}\nevent: {kind}\ndata: {payload}\n\n" for i, kind, payload in events)
+    return after, ": keepalive\n\n"
+
+def sse_stream(after):
+    yield "retry: 3000\n\n"
+    while True:
+        after, text = sse_chunk(after, event_hub.wait(after, SSE_HEARTBEAT_SECONDS))
+        yield text
+
+if PROFILE_TOKEN:
+    app.wsgi_app = ProfileMiddleware(app.wsgi_app)
 
 # ----------------- ROUTES -----------------
+@lru_cache(maxsize=64)
+def asset_hash(filename, mtime_ns):
+    with open(os.path.join(app.static_folder, filename), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+@app.context_processor
+def static_assets():
+    def asset_url(filename):
+        mtime_ns = os.stat(os.path.join(app.static_folder, filename)).st_mtime_ns
+        return url_for("static", filename=filename, v=asset_hash(filename, mtime_ns))
+    return {"asset_url": asset_url}
+
+def send_static_asset(filename):
+    # Pages link their CSS/JS with a content hash in the URL (asset_url), so browsers may keep them for a
+    # year. Only static files get this; everything else sent with send_file keeps Flask's default.
+    return send_from_directory(app.static_folder, filename, max_age=365 * 24 * 3600)
+
+app.view_functions["static"] = send_static_asset
+
+# Cards per dashboard page; ?per_page= may ask for up to DASHBOARD_MAX_PAGE_SIZE
+DASHBOARD_PAGE_SIZE = int(os.environ.get("DASHBOARD_PAGE_SIZE", "48"))
+DASHBOARD_MAX_PAGE_SIZE = 500
+
+def roster_page():
+    # The slice of the roster picked by ?class=, ?page= and ?per_page=
+    cls = request.args.get("class", "").strip()
+    per_page = max(1, min(request.args.get("per_page", DASHBOARD_PAGE_SIZE, type=int), DASHBOARD_MAX_PAGE_SIZE))
+    page = max(1, request.args.get("page", 1, type=int))
+    students, total = student_index.page(cls, (page - 1) * per_page, per_page)
+    pages = max(1, -(-total // per_page))
+    if page > pages:
+        page = pages
+        students, total = student_index.page(cls, (page - 1) * per_page, per_page)
+    return {"students": students, "total": total, "page": page, "pages": pages, "per_page": per_page, "cls": cls}
+
+def day_totals(on_date, cls, total=None):
+    counts = storage.day_counts(on_date, cls)
+    if total is None:
+        total = student_index.page(cls, 0, 0)[1]
+    counts["Not Marked"] = max(0, total - sum(counts.values()))
+    return counts
+
+def dashboard_page(on_date):
+    # Only the visible slice of the roster is looked up and rendered; the totals come from counters
+    view = roster_page()
+    students = view.pop("students")
+    view["records"] = day_records(on_date, students, storage.attendance_for(on_date, [s["RollNo"] for s in students]))
+    view["counts"] = day_totals(on_date, view["cls"], view["total"])
+    view["default_page_size"] = DASHBOARD_PAGE_SIZE
+    view["classes"] = student_index.classes()
+    return view
+
 @app.route("/")
 def dashboard():
     today = str(date.today())
-    records = load_attendance(today)
     nlp_text = request.args.get('nlp_text', None)
-    return render_template_string(DASHBOARD_TEMPLATE, records=records, today=today, nlp_result="", nlp_text=nlp_text)
+    bulk = request.args.get("bulk") == "1"
+    voice_job = request.args.get("voice_job")
+    return render_template("dashboard.html", today=today, nlp_result="", nlp_text=nlp_text, bulk=bulk, voice_job=voice_job,
+                                  **dashboard_page(today))
 
 @app.route("/nlp_command", methods=["POST"])
 def nlp_command():
@@ -245,800 +2569,287 @@ def nlp_command():
     is_html, result = process_nlp_command(query)
     if is_html:
         today = str(date.today())
-        records = load_attendance(today)
-        return render_template_string(DASHBOARD_TEMPLATE, records=records, today=today, nlp_result=result, nlp_text=None)
+        return render_template("dashboard.html", today=today, nlp_result=result, nlp_text=None, **dashboard_page(today))
     else:
         flash(result, "success" if "✅" in result or "🗑️" in result else "error")
         return redirect(url_for("dashboard"))
 
 @app.route("/nlp_voice", methods=["POST"])
 def nlp_voice():
-    r = sr.Recognizer()
+    # Recognition runs on the voice pool; the caller gets a job id to poll at /nlp_voice/<job_id>
+    audio = request.files.get("audio")
+    job_id = submit_voice_job(audio.read() if audio else None)
+    if request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json":
+        return {"job": job_id, "status": "pending", "url": url_for("nlp_voice_status", job_id=job_id)}, 202
+    return redirect(url_for("dashboard", voice_job=job_id))
+
+@app.route("/nlp_audio", methods=["POST"])
+@app.route("/nlp_audio/<job_id>", methods=["POST"])
+def nlp_audio(job_id=None):
+    # Audio recorded by the browser, as one upload or as chunks: POST /nlp_audio starts a stream and
+    # POST /nlp_audio/<job> appends to it. Phrases are recognized while the upload is still coming in.
+    # ?final=1 ends the stream and answers with the transcript and, unless ?run=0, the command's result.
     try:
-        with sr.Microphone() as source:
-            audio = r.listen(source, timeout=5, phrase_time_limit=5)
-        text = r.recognize_google(audio).lower()
-        return redirect(url_for("dashboard", nlp_text=text))
-    except Exception as e:
-        flash(f"❌ Voice NLP error: {e}", "error")
-        return redirect(url_for("dashboard"))
+        job_id, stream = voice_stream(job_id, request.args.get("format") or request.mimetype)
+    except OSError:
+        return {"status": "error", "error": "❌ Voice NLP error: this audio format needs ffmpeg on the server"}, 415
+    if stream is None:
+        abort(404)
+    try:
+        while True:
+            chunk = request.stream.read(16384)
+            if not chunk:
+                break
+            stream.feed(chunk)
+    except ValueError as e:
+        close_voice_stream(job_id, e)
+        return {"job": job_id, "status": "error", "error": f"❌ Voice NLP error: {e}"}, 400
+    if request.args.get("final") != "1":
+        return {"job": job_id, "status": "receiving", "url": url_for("nlp_audio", job_id=job_id)}, 202
+    close_voice_stream(job_id)
+    status = voice_job_status(job_id, VOICE_MAX_WAIT)
+    if status["status"] == "pending":
+        return status, 202, {"Retry-After": "1"}
+    if status["status"] == "done" and request.args.get("run", "1") == "1":
+        is_html, result = process_nlp_command(status["text"])
+        status.update(html=is_html, result=result)
+    return status
+
+@app.route("/nlp_voice/<job_id>")
+def nlp_voice_status(job_id):
+    status = voice_job_status(job_id, request.args.get("wait", 0, type=float))
+    if status is None:
+        abort(404)
+    if status["status"] == "pending":
+        return status, 200, {"Retry-After": "1"}
+    return status
 
 @app.route("/mark/<rollno>/<status>/<att_date>")
 def mark_attendance(rollno, status, att_date):
-    save_attendance(att_date, rollno, status)
+    if not day_of(att_date):
+        abort(400, "date must be YYYY-MM-DD")
+    marks = checked_marks([(att_date, rollno, status)])
+    if marks is None:
+        abort(400, "status must be Present, Absent or Unclear")
+    save_attendance(*marks[0])
+    status = marks[0][2]
     flash(f"✅ Attendance marked as {status} for RollNo {rollno}", "success")
     return redirect(url_for("dashboard"))
 
+@app.route("/mark_bulk", methods=["POST"])
+def mark_bulk():
+    # JSON: {"date": ..., "marks": [[RollNo, Status], ...]} and/or {"class": ..., "status": ..., "except": [...]}
+    # Form: status_<RollNo>=<Status> fields from the dashboard's bulk mode, or the "mark whole class" form
+    data = request.get_json(silent=True)
+    if data is not None:
+        if not isinstance(data, dict):
+            return api_error("expected a JSON object")
+        on_date = data.get("date") or str(date.today())
+        if not isinstance(on_date, str) or not day_of(on_date):
+            return api_error("date must be YYYY-MM-DD")
+        pairs = data.get("marks", [])
+        if not isinstance(pairs, list) or not all(isinstance(p, list) and len(p) == 2 and all(isinstance(v, str) for v in p) for p in pairs):
+            return api_error("marks must be a list of [RollNo, Status] string pairs")
+        exceptions = data.get("except", [])
+        if not isinstance(data.get("class") or "", str) or not isinstance(exceptions, list) or not all(isinstance(e, str) for e in exceptions):
+            return api_error("class must be a string and except a list of roll numbers or names")
+        marks = [(on_date, roll, status) for roll, status in pairs]
+        if data.get("class"):
+            marks += class_marks(on_date, data["class"], data.get("status", "Present"),
+                                 exceptions, data.get("except_status", "Absent"))
+        marks = checked_marks(marks)
+        if marks is None:
+            return api_error("status must be Present, Absent or Unclear")
+        save_attendance_many(marks)
+        return {"date": on_date, "marked": len(marks)}
+
+    form = request.form
+    on_date = form.get("date") or str(date.today())
+    if not day_of(on_date):
+        abort(400, "date must be YYYY-MM-DD")
+    marks = [(on_date, k[len("status_"):], v) for k, v in form.items() if k.startswith("status_") and v]
+    if form.get("class"):
+        marks += class_marks(on_date, form["class"], form.get("status", "Present"),
+                             form.get("except", "").split(","), form.get("except_status", "Absent"))
+    marks = checked_marks(marks)
+    if marks is None:
+        abort(400, "status must be Present, Absent or Unclear")
+    save_attendance_many(marks)
+    flash(f"✅ Attendance saved for {len(marks)} students", "success")
+    return redirect(url_for("dashboard"))
+
 @app.route("/add_student", methods=["POST"])
 def add_student():
     name = request.form["name"]
     cls = request.form["class"]
     rollno = request.form["rollno"]
-    with open(STUDENTS_FILE, "a", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow([name, cls, rollno])
+    storage.add_student(name, cls, rollno)
     flash(f"✅ Student {name} added successfully!", "success")
     return redirect(url_for("dashboard"))
 
 @app.route("/delete_student/<rollno>")
 def delete_student(rollno):
-    students = load_students()
-    students = [s for s in students if s["RollNo"] != rollno]
-    with open(STUDENTS_FILE, "w", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=["Name", "Class", "RollNo"])
-        writer.writeheader()
-        writer.writerows(students)
+    storage.delete_student(rollno)
     flash(f"🗑️ Student RollNo {rollno} deleted", "success")
     return redirect(url_for("dashboard"))
 
 @app.route("/month_report")
 def month_report():
     today = date.today()
-    report = get_month_report(today.month, today.year)
-    details = get_month_details(today.month, today.year)
-    return render_template_string(MONTH_TEMPLATE, report=report, details=details, month=today.strftime("%B"), month_num=today.month, year=today.year)
+    report, details = get_month_data(today.month, today.year)
+    return render_template("month.html", report=report, details=record_tuples(details), month=today.strftime("%B"), month_num=today.month, year=today.year)
 
 # ---------- Downloads ----------
 @app.route("/download_csv")
 def download_csv():
-    month, year = parse_month_year_from_query()
-    report = get_month_report(month, year)
-    details = get_month_details(month, year)
-
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(["Summary for", datetime(year, month, 1).strftime("%B %Y")])
-    writer.writerow(["Name", "Class", "Present", "Absent", "Unclear"])
-    for r in report.values():
-        writer.writerow([r["Name"], r["Class"], r["Present"], r["Absent"], r["Unclear"]])
-    writer.writerow([])
-    writer.writerow(["Detailed Records"])
-    writer.writerow(["Date", "Name", "Class", "RollNo", "Status"])
-    for d in details:
-        writer.writerow([d["Date"], d["Name"], d["Class"], d["RollNo"], d["Status"]])
-
-    mem = io.BytesIO(buf.getvalue().encode("utf-8"))
-    mem.seek(0)
-    filename = f"attendance_{year}_{month:02d}.csv"
-    return send_file(mem, mimetype="text/csv", as_attachment=True, download_name=filename)
+    start, end, cls, month, title, stem = parse_export_query()
+    headers = {"Content-Disposition": f"attachment; filename={stem}.csv"}
+    if month:
+        # Month exports are small enough to keep; ranges are only ever streamed
+        key, version = ("csv", *month, cls and cls.lower()), storage.month_version(*month)
+        body = report_cache.get(key, version)
+        if body is not None:
+            return Response(body, mimetype="text/csv", headers=headers)
+        rows = record_tuples(get_month_details(*month), cls)
+        chunks = cache_chunks(csv_export_chunks(title, export_summary(start, end, cls, month), rows), key, version)
+    else:
+        chunks = csv_export_chunks(title, export_summary(start, end, cls), record_tuples(storage.iter_attendance(start, end, cls)))
+    return Response(stream_with_context(chunks), mimetype="text/csv", headers=headers)
 
 @app.route("/download_pdf")
 def download_pdf():
     month, year = parse_month_year_from_query()
-    report = get_month_report(month, year)
-    details = get_month_details(month, year)
+    job = month_pdf_job(month, year)
+    try:
+        pdf = job.result(timeout=PDF_WAIT_SECONDS)
+    except FutureTimeout:
+        # Still rendering in the background; the browser retries and picks up the cached result
+        return PDF_PENDING_PAGE, 202, {"Retry-After": "2"}
+    filename = f"attendance_{year}_{month:02d}.pdf"
+    # The same ?month=&year= URL gets a new PDF after every mark, so browsers must not reuse an old one
+    return send_file(io.BytesIO(pdf), mimetype="application/pdf", as_attachment=True, download_name=filename, max_age=0)
 
-    mem = io.BytesIO()
-    doc = SimpleDocTemplate(mem, pagesize=A4)
-    elems = []
-    styles = getSampleStyleSheet()
-
-    title = Paragraph(f"<b>Attendance Report - {datetime(year, month, 1).strftime('%B %Y')}</b>", styles["Title"])
-    elems.append(title)
-    elems.append(Spacer(1, 12))
-
-    # Summary table
-    summary_data = [["Name", "Class", "Present", "Absent", "Unclear"]]
-    for r in report.values():
-        summary_data.append([r["Name"], r["Class"], r["Present"], r["Absent"], r["Unclear"]])
-
-    tbl = Table(summary_data, repeatRows=1)
-    tbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#2563eb")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#eef2ff")]),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-        ("ALIGN", (2,1), (-1,-1), "CENTER"),
-    ]))
-    elems.append(Paragraph("<b>Summary</b>", styles["Heading2"]))
-    elems.append(tbl)
-    elems.append(Spacer(1, 18))
+# ---------- Metrics ----------
+@app.route("/metrics")
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        abort(404)
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
-    # Detailed table
-    detail_data = [["Date", "Name", "Class", "RollNo", "Status"]]
-    for d in details:
-        detail_data.append([d["Date"], d["Name"], d["Class"], d["RollNo"], d["Status"]])
-
-    dtbl = Table(detail_data, repeatRows=1)
-    dtbl.setStyle(TableStyle([
-        ("BACKGROUND", (0,0), (-1,0), colors.HexColor("#16a34a")),
-        ("TEXTCOLOR", (0,0), (-1,0), colors.white),
-        ("GRID", (0,0), (-1,-1), 0.25, colors.grey),
-        ("ROWBACKGROUNDS", (0,1), (-1,-1), [colors.whitesmoke, colors.HexColor("#ecfdf5")]),
-        ("FONTNAME", (0,0), (-1,0), "Helvetica-Bold"),
-        ("FONTSIZE", (0,0), (-1,-1), 9),
-    ]))
-    elems.append(Paragraph("<b>Detailed Records</b>", styles["Heading2"]))
-    elems.append(dtbl)
+# ----------------- JSON API -----------------
+def api_error(message, code=400):
+    return {"error": message}, code
 
-    doc.build(elems)
-    mem.seek(0)
-    filename = f"attendance_{year}_{month:02d}.pdf"
-    return send_file(mem, mimetype="application/pdf", as_attachment=True, download_name=filename)
-
-# ----------------- HTML -----------------
-DASHBOARD_TEMPLATE = """
-<!doctype html>
-<html>
-<head>
-<title>Attendance Dashboard</title>
-<meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-<style>
-:root {
-  --bg-primary: #f0f4f8;
-  --bg-card: #ffffff;
-  --text-primary: #1a202c;
-  --text-secondary: #4a5568;
-  --border-color: #e2e8f0;
-  --accent-main: #3498db;
-  --accent-secondary: #2ecc71;
-  --good: #27ae60;
-  --bad: #e74c3c;
-  --warn: #f39c12;
-  --neutral: #7f8c8d;
-}
-.dark-mode {
-  --bg-primary: #1a202c;
-  --bg-card: #2d3748;
-  --text-primary: #e2e8f0;
-  --text-secondary: #a0aec0;
-  --border-color: #4a5568;
-  --accent-main: #63b3ed;
-  --accent-secondary: #48bb78;
-  --good: #2ecc71;
-  --bad: #e74c3c;
-  --warn: #f39c12;
-  --neutral: #95a5a6;
-}
-* { box-sizing: border-box; margin: 0; padding: 0; }
-body {
-  font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-  background-color: var(--bg-primary);
-  color: var(--text-primary);
-  min-height: 100vh;
-}
-.container {
-  max-width: 1200px;
-  margin: 20px auto;
-  padding: 0 20px;
-}
-.header {
-  display: flex;
-  justify-content: space-between;
-  align-items: center;
-  padding: 20px;
-  background-color: var(--bg-card);
-  border-bottom: 1px solid var(--border-color);
-}
-.header h1 {
-  font-size: 1.5rem;
-  font-weight: 700;
-  color: var(--accent-main);
-}
-.theme-toggle {
-  background: transparent;
-  border: 1px solid var(--border-color);
-  border-radius: 50%;
-  width: 40px;
-  height: 40px;
-  cursor: pointer;
-  font-size: 1.2rem;
-  color: var(--text-primary);
-}
-.dashboard-actions {
-  display: flex;
-  justify-content: flex-end;
-  align-items: center;
-  gap: 10px;
-  margin-bottom: 20px;
-}
-.btn {
-  padding: 10px 15px;
-  border: none;
-  border-radius: 8px;
-  cursor: pointer;
-  font-weight: 600;
-  color: white;
-  background-color: var(--accent-main);
-  text-decoration: none;
-  display: inline-block;
-  white-space: nowrap;
-}
-.btn.secondary { background-color: var(--accent-secondary); }
-.btn.warn { background-color: var(--warn); }
-.btn.delete { background-color: var(--neutral); }
-.btn:hover { opacity: 0.9; }
-.card-grid {
-  display: grid;
-  grid-template-columns: repeat(auto-fit, minmax(280px, 1fr));
-  gap: 20px;
-  margin-top: 20px;
-}
-.card {
-  background-color: var(--bg-card);
-  border: 1px solid var(--border-color);
-  border-radius: 12px;
-  padding: 20px;
-}
-.card h3 {
-  font-size: 1.25rem;
-  margin-bottom: 5px;
-}
-.card p {
-  color: var(--text-secondary);
-  font-size: 0.9rem;
-}
-.card .status-badge {
-  display: inline-block;
-  padding: 5px 10px;
-  border-radius: 6px;
-  font-size: 0.8rem;
-  color: white;
-  margin-top: 10px;
-}
-.status-present { background-color: var(--good); }
-.status-absent { background-color: var(--bad); }
-.status-unclear { background-color: var(--warn); }
-.status-not-marked { background-color: var(--neutral); }
-.card-actions {
-  margin-top: 15px;
-  display: flex;
-  flex-wrap: wrap;
-  gap: 8px;
-}
-.card-actions a, .card-actions button {
-  font-size: 0.8rem;
-  padding: 6px 10px;
-  border-radius: 6px;
-}
-.form-section {
-  background-color: var(--bg-card);
-  border: 1px solid var(--border-color);
-  border-radius: 12px;
-  padding: 20px;
-  margin-top: 20px;
-}
-.form-section h3 {
-  margin-bottom: 15px;
-}
-.form-section form {
-  display: flex;
-  flex-direction: column;
-  gap: 10px;
-}
-.form-section input {
-  padding: 10px;
-  border: 1px solid var(--border-color);
-  border-radius: 8px;
-  background-color: transparent;
-  color: var(--text-primary);
-}
-.form-section button {
-  padding: 10px 15px;
-  border: none;
-  border-radius: 8px;
-  cursor: pointer;
-  font-weight: 600;
-  color: white;
-  background-color: var(--accent-main);
-}
-.flash-message {
-  position: fixed;
-  bottom: 20px;
-  right: 20px;
-  padding: 15px;
-  border-radius: 8px;
-  color: white;
-  font-weight: bold;
-  box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-  z-index: 1000;
-}
-.flash-message.success { background-color: var(--good); }
-.flash-message.error { background-color: var(--bad); }
-/* Modal Styles */
-.modal {
-  display: none;
-  position: fixed;
-  z-index: 1;
-  left: 0;
-  top: 0;
-  width: 100%;
-  height: 100%;
-  overflow: auto;
-  background-color: rgba(0,0,0,0.4);
-  backdrop-filter: blur(5px);
-  justify-content: center;
-  align-items: center;
-}
-.modal-content {
-  background-color: var(--bg-card);
-  padding: 30px;
-  border-radius: 10px;
-  text-align: center;
-  max-width: 400px;
-  width: 90%;
-  border: 1px solid var(--border-color);
-}
-.modal-content h4 {
-  margin-bottom: 15px;
-}
-.modal-content .modal-buttons {
-  display: flex;
-  justify-content: center;
-  gap: 10px;
-}
-.modal-buttons .btn {
-  padding: 8px 16px;
-}
-.modal-buttons .btn.cancel {
-  background-color: var(--neutral);
-}
-.nlp-result {
-  background-color: var(--bg-card);
-  border: 1px solid var(--border-color);
-  border-radius: 12px;
-  padding: 20px;
-  margin-top: 20px;
-}
-.nlp-result table { width: 100%; border-collapse: collapse; }
-.nlp-result th, .nlp-result td { padding: 10px; border: 1px solid var(--border-color); text-align: left; }
-.nlp-result ul { list-style-type: none; padding: 0; }
-.nlp-result li { padding: 8px 0; border-bottom: 1px solid var(--border-color); }
-.nlp-result li:last-child { border-bottom: none; }
-.search-container {
-    position: relative;
-    width: 100%;
-    margin-bottom: 15px;
-}
-.search-container input {
-    width: 100%;
-    padding: 10px 10px 10px 40px; /* Adjust padding for the icon */
-    border: 1px solid var(--border-color);
-    border-radius: 20px; /* Rounded corners for the input */
-    background-color: var(--bg-primary);
-    color: var(--text-primary);
-    transition: all 0.3s ease;
-}
-.search-container input:focus {
-    outline: none;
-    border-color: var(--accent-main);
-    box-shadow: 0 0 0 2px rgba(52, 152, 219, 0.2);
-}
-.search-container .search-icon {
-    position: absolute;
-    left: 15px;
-    top: 50%;
-    transform: translateY(-50%);
-    color: var(--text-secondary);
-}
-</style>
-</head>
-<body>
-<div class="header">
-  <h1>Attendance Dashboard</h1>
-  <button class="theme-toggle" onclick="toggleTheme()" aria-label="Toggle Theme">☀️</button>
-</div>
-
-<div class="container">
-  <div class="dashboard-actions">
-    <a href="/month_report" class="btn">📊 Monthly Report</a>
-  </div>
-
-  <section class="card-grid">
-    {% for r in records %}
-    <div class="card">
-      <h3>{{r['Name']}} <span style="font-size:0.9em; font-weight:normal; color:var(--text-secondary);">({{r['Class']}} • Roll {{r['RollNo']}})</span></h3>
-      {% if r['Status']=="Present" %}<span class="status-badge status-present">Present</span>
-      {% elif r['Status']=="Absent" %}<span class="status-badge status-absent">Absent</span>
-      {% elif r['Status']=="Unclear" %}<span class="status-badge status-unclear">Unclear</span>
-      {% else %}<span class="status-badge status-not-marked">Not Marked</span>{% endif %}
-      
-      <div class="card-actions">
-        <a href="/mark/{{r['RollNo']}}/Present/{{today}}" class="btn secondary">Present</a>
-        <a href="/mark/{{r['RollNo']}}/Absent/{{today}}" class="btn warn">Absent</a>
-        <a href="/mark/{{r['RollNo']}}/Unclear/{{today}}" class="btn">Unclear</a>
-        <button class="btn delete" onclick="showModal('{{r['RollNo']}}', '{{r['Name']}}')">Delete</button>
-      </div>
-    </div>
-    {% endfor %}
-  </section>
-  
-  {% if nlp_result %}
-  <div class="nlp-result">
-    {{ nlp_result|safe }}
-  </div>
-  {% endif %}
-
-  <section class="form-section">
-    <h3>➕ Add Student</h3>
-    <form method="POST" action="/add_student">
-      <input name="name" placeholder="Name" required>
-      <input name="class" placeholder="Class" required>
-      <input name="rollno" placeholder="Roll No" required>
-      <button class="btn">Add Student</button>
-    </form>
-  </section>
-
-  <section class="form-section">
-    <h3>🤖 NLP Commands</h3>
-    <form method="POST" action="/nlp_command">
-      <input name="query" placeholder="e.g., show students  OR  remove all students" required>
-      <button class="btn">Run Command</button>
-    </form>
-    <form method="POST" action="/nlp_voice" style="margin-top:15px;">
-      <button class="btn secondary">🎤 Speak Command</button>
-    </form>
-  </section>
-</div>
-
-<div id="deleteModal" class="modal">
-  <div class="modal-content">
-    <h4>Confirm Deletion</h4>
-    <p>Are you sure you want to delete <span id="studentName"></span>?</p>
-    <p>This action cannot be undone.</p>
-    <div class="modal-buttons">
-      <button class="btn cancel" onclick="hideModal('deleteModal')">Cancel</button>
-      <a id="confirmDeleteBtn" class="btn red">Delete</a>
-    </div>
-  </div>
-</div>
-
-<div id="nlpConfirmModal" class="modal">
-  <div class="modal-content">
-    <h4>Confirm Command</h4>
-    <p>Are you sure you want to run the command "<span id="nlpCommandText"></span>"?</p>
-    <div class="modal-buttons">
-      <button class="btn cancel" onclick="hideModal('nlpConfirmModal')">Cancel</button>
-      <form id="nlpConfirmForm" method="POST" action="/nlp_command" style="display:inline;">
-        <input type="hidden" name="query" id="nlpHiddenQuery">
-        <button type="submit" class="btn secondary">Confirm</button>
-      </form>
-    </div>
-  </div>
-</div>
-
-{% with messages = get_flashed_messages(with_categories=true) %}
-{% if messages %}
-  {% for category, message in messages %}
-  <div class="flash-message {{ category }}">{{ message }}</div>
-  {% endfor %}
-{% endif %}
-{% endwith %}
-
-<script>
-// Theme Toggle
-function toggleTheme() {
-    const body = document.body;
-    body.classList.toggle('dark-mode');
-    const isDark = body.classList.contains('dark-mode');
-    localStorage.setItem('theme', isDark ? 'dark' : 'light');
-    document.querySelector('.theme-toggle').innerText = isDark ? '🌙' : '☀️';
-}
-document.addEventListener('DOMContentLoaded', () => {
-    if (localStorage.getItem('theme') === 'dark') {
-        document.body.classList.add('dark-mode');
-        document.querySelector('.theme-toggle').innerText = '🌙';
-    }
-});
-
-// Modal for delete confirmation
-function showModal(id) {
-    document.getElementById(id).style.display = 'flex';
-}
-function hideModal(id) {
-    document.getElementById(id).style.display = 'none';
-}
-
-// Logic for NLP voice command confirmation
-window.onload = function() {
-    const nlpText = "{{ nlp_text }}";
-    if (nlpText && nlpText !== 'None') {
-        const modal = document.getElementById('nlpConfirmModal');
-        const commandText = document.getElementById('nlpCommandText');
-        const hiddenQuery = document.getElementById('nlpHiddenQuery');
-
-        commandText.innerText = nlpText;
-        hiddenQuery.value = nlpText;
-        showModal('nlpConfirmModal');
-    }
+@app.route("/api/students")
+def api_students():
+    return roster_page()
 
-    // Existing delete modal function
-    window.showDeleteModal = function(rollNo, name) {
-        document.getElementById('studentName').innerText = name;
-        document.getElementById('confirmDeleteBtn').href = `/delete_student/${rollNo}`;
-        showModal('deleteModal');
-    };
-    
-    // Fix for the old function
-    window.showModal = function(rollNo, name) {
-        document.getElementById('studentName').innerText = name;
-        document.getElementById('confirmDeleteBtn').href = `/delete_student/${rollNo}`;
-        document.getElementById('deleteModal').style.display = 'flex';
-    };
-    window.hideModal = function(modalId) {
-        document.getElementById(modalId).style.display = 'none';
-    };
-};
-</script>
-</body>
-</html>
-"""
-
-MONTH_TEMPLATE = """
-<!doctype html>
-<html>
-<head>
-<title>Monthly Report</title>
-<meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-<script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-<style>
-:root {
-  --bg-primary: #f0f4f8;
-  --bg-card: #ffffff;
-  --text-primary: #1a202c;
-  --text-secondary: #4a5568;
-  --border-color: #e2e8f0;
-  --accent-main: #3498db;
-  --accent-secondary: #2ecc71;
-  --good: #27ae60;
-  --bad: #e74c3c;
-  --warn: #f39c12;
-  --neutral: #7f8c8d;
-}
-.dark-mode {
-  --bg-primary: #1a202c;
-  --bg-card: #2d3748;
-  --text-primary: #e2e8f0;
-  --text-secondary: #a0aec0;
-  --border-color: #4a5568;
-  --accent-main: #63b3ed;
-  --accent-secondary: #48bb78;
-  --good: #2ecc71;
-  --bad: #e74c3c;
-  --warn: #f39c12;
-  --neutral: #95a5a6;
-}
-* { box-sizing: border-box; margin: 0; padding: 0; }
-body {
-  font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-  background-color: var(--bg-primary);
-  color: var(--text-primary);
-  min-height: 100vh;
-}
-.container {
-  max-width: 1200px;
-  margin: 20px auto;
-  padding: 0 20px;
-}
-.header {
-  display: flex;
-  justify-content: space-between;
-  align-items: center;
-  padding: 20px;
-  background-color: var(--bg-card);
-  border-bottom: 1px solid var(--border-color);
-}
-.header h1 {
-  font-size: 1.5rem;
-  font-weight: 700;
-  color: var(--accent-main);
-}
-.theme-toggle {
-  background: transparent;
-  border: 1px solid var(--border-color);
-  border-radius: 50%;
-  width: 40px;
-  height: 40px;
-  cursor: pointer;
-  font-size: 1.2rem;
-  color: var(--text-primary);
-}
-.report-actions {
-  display: flex;
-  justify-content: flex-start;
-  flex-wrap: wrap;
-  gap: 10px;
-  margin-top: 20px;
-}
-.btn {
-  padding: 10px 15px;
-  border: none;
-  border-radius: 8px;
-  cursor: pointer;
-  font-weight: 600;
-  color: white;
-  background-color: var(--accent-main);
-  text-decoration: none;
-  display: inline-block;
-  white-space: nowrap;
-}
-.btn.green { background-color: var(--accent-secondary); }
-.btn.red { background-color: var(--bad); }
-.btn:hover { opacity: 0.9; }
-.card {
-  background-color: var(--bg-card);
-  border: 1px solid var(--border-color);
-  border-radius: 12px;
-  padding: 20px;
-  margin-top: 20px;
-}
-.card h3 {
-  margin-bottom: 15px;
-}
-.card table {
-  width: 100%;
-  border-collapse: collapse;
-}
-.card th, .card td {
-  padding: 12px;
-  text-align: left;
-  border-bottom: 1px solid var(--border-color);
-}
-.card th {
-  background-color: rgba(52, 152, 219, 0.1);
-  font-weight: 600;
-}
-.chart-container {
-  display: flex;
-  flex-direction: column;
-  align-items: center;
-  gap: 10px;
-  margin-bottom: 20px;
-}
-.chart-container label {
-  color: var(--text-secondary);
-  font-size: 0.9rem;
-}
-.chart-container select {
-  padding: 8px;
-  border: 1px solid var(--border-color);
-  border-radius: 8px;
-  background-color: var(--bg-card);
-  color: var(--text-primary);
-}
-.chart-box {
-  width: min(450px, 90%);
-}
-</style>
-</head>
-<body>
-<div class="header">
-  <h1>Monthly Report ({{month}} {{year}})</h1>
-  <button class="theme-toggle" onclick="toggleTheme()">☀️</button>
-</div>
-
-<div class="container">
-  <div class="report-actions">
-    <a href="/" class="btn">⬅️ Back</a>
-    <a class="btn green" href="/download_csv?month={{month_num}}&year={{year}}">⬇️ Download CSV</a>
-    <a class="btn red" href="/download_pdf?month={{month_num}}&year={{year}}">📄 Download PDF</a>
-  </div>
-
-  <div class="card">
-    <div class="chart-container">
-      <h3>Attendance Chart</h3>
-      <label>Chart type:</label>
-      <select id="chartType" onchange="renderChart()">
-        <option value="pie">Pie</option>
-        <option value="bar">Bar</option>
-        <option value="doughnut">Doughnut</option>
-      </select>
-      <div class="chart-box">
-        <canvas id="attendanceChart"></canvas>
-      </div>
-    </div>
-  </div>
-
-  <div class="card">
-    <h3>Summary</h3>
-    <table>
-      <thead>
-        <tr><th>Name</th><th>Class</th><th>Present</th><th>Absent</th><th>Unclear</th></tr>
-      </thead>
-      <tbody>
-        {% for r in report.values() %}
-        <tr>
-          <td>{{r['Name']}}</td>
-          <td>{{r['Class']}}</td>
-          <td>{{r['Present']}}</td>
-          <td>{{r['Absent']}}</td>
-          <td>{{r['Unclear']}}</td>
-        </tr>
-        {% endfor %}
-      </tbody>
-    </table>
-  </div>
-
-  <div class="card">
-    <h3>Detailed Records</h3>
-    <table>
-      <thead>
-        <tr><th>Date</th><th>Name</th><th>Class</th><th>Roll No</th><th>Status</th></tr>
-      </thead>
-      <tbody>
-        {% for d in details %}
-        <tr>
-          <td>{{d['Date']}}</td><td>{{d['Name']}}</td><td>{{d['Class']}}</td><td>{{d['RollNo']}}</td><td>{{d['Status']}}</td>
-        </tr>
-        {% endfor %}
-      </tbody>
-    </table>
-  </div>
-</div>
-
-<script>
-// Theme Toggle
-function toggleTheme() {
-    const body = document.body;
-    body.classList.toggle('dark-mode');
-    const isDark = body.classList.contains('dark-mode');
-    localStorage.setItem('theme', isDark ? 'dark' : 'light');
-    document.querySelector('.theme-toggle').innerText = isDark ? '🌙' : '☀️';
-    renderChart(); // Re-render chart to update colors
-}
-document.addEventListener('DOMContentLoaded', () => {
-    if (localStorage.getItem('theme') === 'dark') {
-        document.body.classList.add('dark-mode');
-        document.querySelector('.theme-toggle').innerText = '🌙';
-    }
-    renderChart();
-});
-
-// Chart.js
-let chart;
-function renderChart(){
-  if(chart){ chart.destroy(); }
-  const type = document.getElementById('chartType').value;
-  const ctx = document.getElementById('attendanceChart').getContext('2d');
-  const textColor = getComputedStyle(document.body).getPropertyValue('--text-primary');
-  const data = {
-    labels: ["Present","Absent","Unclear"],
-    datasets: [{
-      data: [{{report.values()|sum(attribute='Present')}}, {{report.values()|sum(attribute='Absent')}}, {{report.values()|sum(attribute='Unclear')}}],
-      backgroundColor: ['#2ecc71', '#e74c3c', '#f39c12']
-    }]
-  };
-  chart = new Chart(ctx, {
-    type,
-    data,
-    options: {
-      responsive: true,
-      plugins: {
-        legend: { labels: { color: textColor } }
-      },
-      scales: (type === 'bar') ? {
-        x: { ticks: { color: textColor }, grid: { color: 'rgba(127,140,141,0.2)' } },
-        y: { ticks: { color: textColor }, grid: { color: 'rgba(127,140,141,0.2)' }, beginAtZero: true }
-      } : {}
-    }
-  });
-}
-</script>
-</body>
-</html>
-"""
+@app.route("/api/students", methods=["POST"])
+def api_add_student():
+    data = request.get_json(silent=True) or {}
+    name, cls, rollno = (str(data.get(k, "")).strip() for k in ("name", "class", "rollno"))
+    if not (name and cls and rollno):
+        return api_error("name, class and rollno are required")
+    storage.add_student(name, cls, rollno)
+    return {"Name": name, "Class": cls, "RollNo": rollno}, 201
+
+@app.route("/api/students/<rollno>", methods=["DELETE"])
+def api_delete_student(rollno):
+    if not student_index.find(rollno):
+        return api_error(f"student {rollno} not found", 404)
+    storage.delete_student(rollno)
+    return {"deleted": rollno}
+
+@app.route("/api/attendance/<on_date>")
+def api_attendance(on_date):
+    # One page of the roster with each student's status on `on_date`, and the day's totals
+    if not day_of(on_date):
+        return api_error("date must be YYYY-MM-DD")
+    view = roster_page()
+    students = view.pop("students")
+    view["records"] = day_records(on_date, students, storage.attendance_for(on_date, [s["RollNo"] for s in students]))
+    view["counts"] = day_totals(on_date, view["cls"], view["total"])
+    view["date"] = on_date
+    return view
+
+@app.route("/api/attendance/<on_date>/<rollno>", methods=["PUT", "POST"])
+def api_mark(on_date, rollno):
+    # {"status": "Present" | "Absent" | "Unclear"}; answers with the student's record and the day's totals
+    # for ?class= (or everyone), which is all a dashboard card needs to redraw itself
+    status = str((request.get_json(silent=True) or request.form).get("status", "")).capitalize()
+    if status not in STATUSES:
+        return api_error("status must be Present, Absent or Unclear")
+    if not day_of(on_date):
+        return api_error("date must be YYYY-MM-DD")
+    if not student_index.find(rollno):
+        return api_error(f"student {rollno} not found", 404)
+    save_attendance(on_date, rollno, status)
+    record = storage.get_attendance(on_date, rollno)
+    return {"record": record, "counts": day_totals(on_date, request.args.get("class", "").strip())}
+
+@app.route("/api/events")
+def api_events():
+    # Server-Sent Events: a "marks" event for every committed batch of marks in this process
+    after = sse_start(request.headers.get("Last-Event-ID", request.args.get("last_id")))
+    return Response(sse_stream(after), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/month/<int:year>/<int:month>")
+def api_month(year, month):
+    # Per-student totals for the month; ?details=1 adds every record
+    if not 1 <= month <= 12:
+        return api_error("month must be 1-12")
+    if request.args.get("details") == "1":
+        report, details = get_month_data(month, year)
+    else:
+        report, details = get_month_report(month, year), None
+    result = {"year": year, "month": month, "summary": list(report.values())}
+    if details is not None:
+        result["details"] = list(details)
+    return result
+
+def api_period():
+    # (start, end) from ?start=&end=, else ?month=&year=, else the whole of ?year= (this year by default);
+    # None when they are malformed
+    start, end = request.args.get("start") or None, request.args.get("end") or None
+    if start or end:
+        return None if (start and not day_of(start)) or (end and not day_of(end)) else (start, end)
+    year = request.args.get("year", type=int) or date.today().year
+    month = request.args.get("month", type=int)
+    if month is not None:
+        return month_bounds(month, year) if 1 <= month <= 12 and 1 <= year <= 9999 else None
+    return (f"{year:04d}-01-01", f"{year:04d}-12-31") if 1 <= year <= 9999 else None
+
+@app.route("/api/rollup")
+def api_rollup():
+    # Totals and attendance percentage grouped by ?by= (any of student, class, month, term; default class)
+    # over the api_period; optional ?class=
+    by = [d.strip() for d in request.args.get("by", "class").lower().split(",") if d.strip()]
+    if not by or any(d not in ROLLUP_DIMENSIONS for d in by):
+        return api_error("by must be one or more of " + ", ".join(ROLLUP_DIMENSIONS))
+    period = api_period()
+    if period is None:
+        return api_error("give start/end as YYYY-MM-DD, or a month of 1-12 and a year")
+    cls = request.args.get("class") or None
+    return {"by": by, "start": period[0], "end": period[1], "class": cls, "engine": aggregator.name,
+            "rows": rollup(by, *period, cls)}
+
+@app.route("/api/rankings")
+def api_rankings():
+    # Students ranked by attendance percentage over the api_period; ?order=asc puts the lowest first,
+    # ?limit= (default 20), ?min_records= (default 1), optional ?class=
+    period = api_period()
+    if period is None:
+        return api_error("give start/end as YYYY-MM-DD, or a month of 1-12 and a year")
+    order = request.args.get("order", "desc").lower()
+    if order not in ("asc", "desc"):
+        return api_error("order must be asc or desc")
+    limit = request.args.get("limit", 20, type=int)
+    min_records = request.args.get("min_records", 1, type=int)
+    cls = request.args.get("class") or None
+    ranked = attendance_rankings(*period, cls, lowest=order == "asc", min_records=max(min_records, 1))
+    return {"start": period[0], "end": period[1], "class": cls, "order": order, "total": len(ranked),
+            "students": ranked[:max(limit, 0)]}
 
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,319 @@
+# Async serving mode: uvicorn asgi:app (any ASGI server works).
+# Long-lived and slow requests - live updates, voice polls and uploads, PDF downloads - are handled here on
+# the event loop without holding a thread. Every other route runs the Flask app on a thread pool, so
+# blocking storage I/O never stalls the loop. PDFs are built in worker processes.
+import asyncio, functools, json, os, re, sys, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qs, quote
+
+os.environ.setdefault("PDF_PROCESSES", str(os.cpu_count() or 2))
+import Main
+
+# Threads for storage work and for the Flask routes
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "32"))
+
+class ASGIApp:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.pool = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix="asgi")
+        self.loop = None
+        self.published = None
+        # (method, path pattern, handler, the Flask rule it stands in for)
+        self.routes = [
+            ("GET", re.compile(r"/api/events"), self.events, "/api/events"),
+            ("GET", re.compile(r"/nlp_voice/(?P<job_id>[^/]+)"), self.voice_status, "/nlp_voice/<job_id>"),
+            ("POST", re.compile(r"/nlp_audio(?:/(?P<job_id>[^/]+))?"), self.audio, "/nlp_audio/<job_id>"),
+            ("GET", re.compile(r"/download_pdf"), self.download_pdf, "/download_pdf"),
+        ]
+        Main.event_hub.watch(self.on_publish)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.published = asyncio.Event()
+        for method, pattern, handler, rule in self.routes:
+            match = pattern.fullmatch(scope["path"])
+            if match and scope["method"] == method:
+                request = Request(scope, receive)
+                if Main.profile_requested(request.header("x-profile") or request.arg("profile") or ""):
+                    # The profiler wraps the Flask app, so profiled requests take the Flask route
+                    break
+                handler = functools.partial(handler, request, **match.groupdict())
+                if Main.METRICS_ENABLED:
+                    return await self.timed(rule, method, handler, send)
+                return await handler(send)
+        await self.run_wsgi(scope, receive, send)
+
+    async def timed(self, rule, method, handler, send):
+        # Native routes are reported in /metrics the same way as the Flask ones
+        status, start = ["500"], time.perf_counter()
+        async def sending(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+        try:
+            await handler(sending)
+        finally:
+            Main.metrics.observe("attendance_request_seconds", (("route", rule), ("method", method), ("status", status[0])),
+                                 time.perf_counter() - start)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def offload(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.pool, fn, *args)
+
+    # ---------- Live updates ----------
+    def on_publish(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wake)
+
+    def wake(self):
+        # Every waiting stream holds the current Event; replacing it wakes them all at once
+        self.published.set()
+        self.published = asyncio.Event()
+
+    async def events(self, request, send):
+        after = Main.sse_start(request.header("last-event-id") or request.arg("last_id"))
+        await start_response(send, 200, [("content-type", "text/event-stream"), ("cache-control", "no-cache"),
+                                         ("x-accel-buffering", "no")])
+        await send_body(send, b"retry: 3000\n\n", more=True)
+        disconnected = asyncio.ensure_future(request.disconnected())
+        try:
+            while not disconnected.done():
+                events = Main.event_hub.wait(after, 0)
+                if events == []:
+                    published = asyncio.ensure_future(self.published.wait())
+                    await asyncio.wait([disconnected, published], timeout=Main.SSE_HEARTBEAT_SECONDS,
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    published.cancel()
+                    if disconnected.done():
+                        break
+                    events = Main.event_hub.wait(after, 0)
+                after, text = Main.sse_chunk(after, events)
+                await send_body(send, text.encode(), more=True)
+        finally:
+            disconnected.cancel()
+
+    # ---------- Voice ----------
+    async def wait_voice_job(self, job_id, wait):
+        with Main.voice_jobs_lock:
+            entry = Main.voice_jobs.get(job_id)
+        if entry is None:
+            return None
+        if wait > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(entry[1])), min(wait, Main.VOICE_MAX_WAIT))
+            except Exception:
+                pass
+        return Main.voice_job_status(job_id)
+
+    async def voice_status(self, request, send, job_id):
+        try:
+            wait = float(request.arg("wait") or 0)
+        except ValueError:
+            wait = 0
+        status = await self.wait_voice_job(job_id, wait)
+        if status is None:
+            return await send_json(send, 404, {"error": "voice job not found"})
+        await send_json(send, 200, status, [("retry-after", "1")] if status["status"] == "pending" else [])
+
+    async def audio(self, request, send, job_id=None):
+        # Same protocol as the Flask view; the body is read as it arrives and each piece is decoded on the pool
+        try:
+            job_id, stream = await self.offload(Main.voice_stream, job_id, request.arg("format") or request.header("content-type"))
+        except OSError:
+            return await send_json(send, 415, {"status": "error", "error": "❌ Voice NLP error: this audio format needs ffmpeg on the server"})
+        if stream is None:
+            return await send_json(send, 404, {"error": "voice job not found"})
+        try:
+            async for chunk in request.body():
+                await self.offload(stream.feed, chunk)
+        except ValueError as e:
+            await self.offload(Main.close_voice_stream, job_id, e)
+            return await send_json(send, 400, {"job": job_id, "status": "error", "error": f"❌ Voice NLP error: {e}"})
+        if request.arg("final") != "1":
+            return await send_json(send, 202, {"job": job_id, "status": "receiving", "url": f"/nlp_audio/{job_id}"})
+        await self.offload(Main.close_voice_stream, job_id)
+        status = await self.wait_voice_job(job_id, Main.VOICE_MAX_WAIT)
+        if status["status"] == "pending":
+            return await send_json(send, 202, status, [("retry-after", "1")])
+        if status["status"] == "done" and (request.arg("run") or "1") == "1":
+            is_html, result = await self.offload(self.run_command, status["text"])
+            status.update(html=is_html, result=result)
+        await send_json(send, 200, status)
+
+    def run_command(self, text):
+        # Some commands render templates, which need a request context
+        with self.flask_app.test_request_context("/nlp_command"):
+            return Main.process_nlp_command(text)
+
+    # ---------- PDF ----------
+    async def download_pdf(self, request, send):
+        today = date.today()
+        month, year = request.int_arg("month") or today.month, request.int_arg("year") or today.year
+        job = await self.offload(Main.month_pdf_job, month, year)
+        try:
+            pdf = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), Main.PDF_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            await start_response(send, 202, [("content-type", "text/html; charset=utf-8"), ("retry-after", "2")])
+            return await send_body(send, Main.PDF_PENDING_PAGE.encode())
+        filename = f"attendance_{year}_{month:02d}.pdf"
+        await start_response(send, 200, [("content-type", "application/pdf"), ("content-length", str(len(pdf))),
+                                         ("content-disposition", f"attachment; filename={quote(filename)}")])
+        await send_body(send, pdf)
+
+    # ---------- Everything else ----------
+    async def run_wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, WSGIInput(loop, receive))
+
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            response = []
+            def start(status, headers, exc_info=None):
+                response[:] = [int(status.split(" ", 1)[0]), [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]]
+            result = self.flask_app(environ, start)
+            try:
+                started = False
+                for chunk in result:
+                    if not started:
+                        call({"type": "http.response.start", "status": response[0], "headers": response[1]})
+                        started = True
+                    if chunk:
+                        call({"type": "http.response.body", "body": chunk, "more_body": True})
+                if not started:
+                    call({"type": "http.response.start", "status": response[0], "headers": response[1]})
+                call({"type": "http.response.body", "body": b""})
+            finally:
+                if hasattr(result, "close"):
+                    result.close()
+
+        await loop.run_in_executor(self.pool, run)
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        self.body_done = False
+
+    def arg(self, name):
+        values = self.query.get(name)
+        return values[0] if values else None
+
+    def int_arg(self, name):
+        value = self.arg(name)
+        return int(value) if value and value.isdigit() else None
+
+    def header(self, name):
+        name = name.encode("latin-1")
+        for k, v in self.scope["headers"]:
+            if k == name:
+                return v.decode("latin-1")
+        return ""
+
+    async def body(self):
+        while not self.body_done:
+            message = await self.receive()
+            if message["type"] == "http.disconnect":
+                raise ValueError("upload interrupted")
+            self.body_done = not message.get("more_body", False)
+            if message.get("body"):
+                yield message["body"]
+
+    async def disconnected(self):
+        while (await self.receive())["type"] != "http.disconnect":
+            pass
+
+class WSGIInput:
+    # wsgi.input for a Flask route running on the pool: reads pull the next body message from the loop
+    def __init__(self, loop, receive):
+        self.loop = loop
+        self.receive = receive
+        self.buffer = bytearray()
+        self.more = True
+
+    def fill(self):
+        message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+        if message["type"] == "http.disconnect":
+            self.more = False
+            return
+        self.buffer += message.get("body", b"")
+        self.more = message.get("more_body", False)
+
+    def take(self, n):
+        data = bytes(self.buffer[:n])
+        del self.buffer[:n]
+        return data
+
+    def read(self, size=-1):
+        while self.more and (size is None or size < 0 or len(self.buffer) < size):
+            self.fill()
+        return self.take(len(self.buffer) if size is None or size < 0 else size)
+
+    def readline(self, size=-1):
+        while self.more and b"\n" not in self.buffer and (size is None or size < 0 or len(self.buffer) < size):
+            self.fill()
+        end = self.buffer.find(b"\n") + 1 or len(self.buffer)
+        return self.take(end if size is None or size < 0 else min(end, size))
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # The body ends where the client's does, with or without a Content-Length
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for k, v in scope["headers"]:
+        k, v = k.decode("latin-1"), v.decode("latin-1")
+        if k == "content-type":
+            environ["CONTENT_TYPE"] = v
+        elif k == "content-length":
+            environ["CONTENT_LENGTH"] = v
+        else:
+            key = "HTTP_" + k.upper().replace("-", "_")
+            environ[key] = environ[key] + "," + v if key in environ else v
+    return environ
+
+async def start_response(send, status, headers):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+
+async def send_body(send, body, more=False):
+    await send({"type": "http.response.body", "body": body, "more_body": more})
+
+async def send_json(send, status, data, headers=()):
+    body = json.dumps(data).encode()
+    await start_response(send, status, [("content-type", "application/json"), ("content-length", str(len(body)))] + list(headers))
+    await send_body(send, body)
+
+app = ASGIApp(Main.app)
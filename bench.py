@@ -0,0 +1,209 @@
+# Benchmarks the hot paths against a generated roster and attendance history, and prints JSON.
+#   python bench.py --students 2000 --days 120 --output results.json
+#   python bench.py --backend sqlite --compare results.json
+# Everything runs in a scratch directory; the project's own CSV files are never touched.
+import argparse, csv, json, os, platform, random, shutil, statistics, subprocess, sys, tempfile, time, tracemalloc
+from collections import Counter
+from datetime import date, datetime, timedelta
+try:
+    import resource
+except ImportError:
+    # Windows has no getrusage; peak_rss_kib is reported as null there
+    resource = None
+
+FIRST_NAMES = ["Aarav", "Aditi", "Alice", "Arjun", "Bob", "Carol", "Chen", "Dave", "Diya", "Eve", "Farah", "Grace",
+               "Hiro", "Ishaan", "Jia", "Kavya", "Liam", "Maya", "Noah", "Olivia", "Priya", "Quinn", "Rohan", "Sara",
+               "Tara", "Uma", "Vikram", "Wei", "Yusuf", "Zara"]
+SURNAMES = ["Sharma", "Patel", "Smith", "Khan", "Garcia", "Nguyen", "Iyer", "Brown", "Singh", "Lopez", "Kim", "Rao"]
+STATUS_WEIGHTS = {"Present": 0.86, "Absent": 0.10, "Unclear": 0.04}
+
+def school_days(days, end):
+    # The last `days` weekdays up to and including `end`
+    found, d = [], end
+    while len(found) < days:
+        if d.weekday() < 5:
+            found.append(d)
+        d -= timedelta(days=1)
+    return sorted(found)
+
+def generate(directory, students, classes, days, seed):
+    # students.csv plus a legacy attendance.csv, which the app migrates into its own layout on start
+    rnd = random.Random(seed)
+    class_names = [f"{9 + i // 4}{'ABCD'[i % 4]}" for i in range(classes)]
+    roster = []
+    for i in range(students):
+        name = f"{rnd.choice(FIRST_NAMES)}{rnd.choice(SURNAMES)}{i // (len(FIRST_NAMES) * len(SURNAMES)) or ''}"
+        roster.append({"Name": name, "Class": class_names[i % classes], "RollNo": str(1000 + i)})
+    with open(os.path.join(directory, "students.csv"), "w", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=["Name", "Class", "RollNo"])
+        w.writeheader()
+        w.writerows(roster)
+    statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+    rows = 0
+    with open(os.path.join(directory, "attendance.csv"), "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["Date", "Name", "Class", "RollNo", "Status"])
+        for d in school_days(days, date.today() - timedelta(days=1)):
+            picks = rnd.choices(statuses, weights, k=students)
+            w.writerows([d.isoformat(), s["Name"], s["Class"], s["RollNo"], st] for s, st in zip(roster, picks))
+            rows += students
+    return roster, rows
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {"n": repeat, "min_ms": round(times[0], 3), "median_ms": round(statistics.median(times), 3),
+            "mean_ms": round(statistics.fmean(times), 3), "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))], 3),
+            "max_ms": round(times[-1], 3)}
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="attendance-bench-")
+    cwd = os.getcwd()
+    try:
+        start = time.perf_counter()
+        roster, rows = generate(workdir, args.students, args.classes, args.days, args.seed)
+        generated_ms = (time.perf_counter() - start) * 1000
+
+        # Main resolves its data files against the working directory when it is imported
+        os.chdir(workdir)
+        os.environ["ATTENDANCE_BACKEND"] = args.backend
+        os.environ.setdefault("PDF_WAIT_SECONDS", "600")
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        start = time.perf_counter()
+        import Main
+        import_ms = (time.perf_counter() - start) * 1000
+
+        rnd = random.Random(args.seed + 1)
+        today = str(date.today())
+        # Report on the month with the most generated history
+        history = Counter((d.year, d.month) for d in school_days(args.days, date.today() - timedelta(days=1)))
+        year, month = max(history, key=lambda k: (history[k], k))
+        client = Main.app.test_client()
+
+        def cold(fn):
+            def call():
+                Main.report_cache.entries.clear()
+                return fn()
+            return call
+
+        def nlp(query):
+            def call():
+                with Main.app.test_request_context("/nlp_command", method="POST"):
+                    return Main.process_nlp_command(query)
+            return call
+
+        def get(path):
+            def call():
+                response = client.get(path)
+                assert response.status_code == 200, (path, response.status_code)
+                return response.get_data()
+            return call
+
+        def mark():
+            s = rnd.choice(roster)
+            Main.save_attendance(today, s["RollNo"], rnd.choice(list(STATUS_WEIGHTS)))
+
+        query = f"?month={month}&year={year}"
+        ops = {
+            "save_attendance": mark,
+            "load_attendance": lambda: Main.load_attendance(today),
+            "get_month_report.cold": cold(lambda: Main.get_month_report(month, year)),
+            "get_month_report.warm": lambda: Main.get_month_report(month, year),
+            "get_month_details.cold": cold(lambda: Main.get_month_details(month, year)),
+            "get_month_details.warm": lambda: Main.get_month_details(month, year),
+            "process_nlp_command.mark": nlp(f"mark {roster[len(roster) // 2]['Name'].lower()} present"),
+            "process_nlp_command.unknown": nlp("what is the weather"),
+            "route./": get("/"),
+            "route./month_report": get("/month_report"),
+            "route./download_csv": cold(get("/download_csv" + query)),
+            "route./download_pdf.cold": cold(get("/download_pdf" + query)),
+            "route./download_pdf.warm": get("/download_pdf" + query),
+            "rollup.class_term": lambda: Main.rollup(("class", "term")),
+            "route./api/rankings": get(f"/api/rankings?year={year}"),
+        }
+        selected = {k: v for k, v in ops.items() if not args.only or any(k.startswith(o) for o in args.only)}
+        results = {}
+        for name, fn in selected.items():
+            repeat = args.repeat if "pdf.cold" not in name else max(1, args.repeat // 10)
+            fn()
+            results[name] = measure(fn, repeat)
+            if args.memory:
+                results[name]["peak_kib"] = peak_memory(fn)
+            print(f"{name:32} median {results[name]['median_ms']:>10.3f} ms", file=sys.stderr)
+
+        return {
+            "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                     "python": platform.python_version(), "platform": platform.platform(), "backend": args.backend,
+                     "students": args.students, "classes": args.classes, "days": args.days, "attendance_rows": rows,
+                     "seed": args.seed, "repeat": args.repeat, "month": f"{year:04d}-{month:02d}"},
+            "setup": {"generate_ms": round(generated_ms, 1), "import_ms": round(import_ms, 1)},
+            "results": results,
+            # ru_maxrss is KiB on Linux and bytes on macOS
+            "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+                            if resource else None,
+        }
+    finally:
+        # --output and --compare paths are relative to where bench.py was started
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(current, baseline_file, threshold):
+    # Median time ratios against an earlier run; anything slower than `threshold` is flagged
+    with open(baseline_file) as f:
+        baseline = json.load(f)["results"]
+    report = {}
+    for name, r in current["results"].items():
+        if name in baseline and baseline[name]["median_ms"] > 0:
+            ratio = r["median_ms"] / baseline[name]["median_ms"]
+            report[name] = {"baseline_ms": baseline[name]["median_ms"], "median_ms": r["median_ms"],
+                            "ratio": round(ratio, 3), "regression": ratio > threshold}
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the attendance app's hot paths.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--classes", type=int, default=20)
+    parser.add_argument("--days", type=int, default=60, help="school days of history before today")
+    parser.add_argument("--backend", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", help="benchmark names (or prefixes) to run")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc peak pass")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--compare", help="earlier JSON output to compare medians against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.compare:
+        result["comparison"] = compare(result, args.compare, args.threshold)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare and any(r["regression"] for r in result["comparison"].values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+// Theme Toggle
+function toggleTheme() {
+    const body = document.body;
+    body.classList.toggle('dark-mode');
+    const isDark = body.classList.contains('dark-mode');
+    localStorage.setItem('theme', isDark ? 'dark' : 'light');
+    document.querySelector('.theme-toggle').innerText = isDark ? '🌙' : '☀️';
+    renderChart(); // Re-render chart to update colors
+}
+document.addEventListener('DOMContentLoaded', () => {
+    if (localStorage.getItem('theme') === 'dark') {
+        document.body.classList.add('dark-mode');
+        document.querySelector('.theme-toggle').innerText = '🌙';
+    }
+    renderChart();
+});
+
+// Chart.js
+let chart;
+function renderChart(){
+  if(chart){ chart.destroy(); }
+  const type = document.getElementById('chartType').value;
+  const ctx = document.getElementById('attendanceChart').getContext('2d');
+  const textColor = getComputedStyle(document.body).getPropertyValue('--text-primary');
+  const data = {
+    labels: ["Present","Absent","Unclear"],
+    datasets: [{
+      data: JSON.parse(document.getElementById('attendanceChart').dataset.counts),
+      backgroundColor: ['#2ecc71', '#e74c3c', '#f39c12']
+    }]
+  };
+  chart = new Chart(ctx, {
+    type,
+    data,
+    options: {
+      responsive: true,
+      plugins: {
+        legend: { labels: { color: textColor } }
+      },
+      scales: (type === 'bar') ? {
+        x: { ticks: { color: textColor }, grid: { color: 'rgba(127,140,141,0.2)' } },
+        y: { ticks: { color: textColor }, grid: { color: 'rgba(127,140,141,0.2)' }, beginAtZero: true }
+      } : {}
+    }
+  });
+}
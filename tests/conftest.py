@@ -0,0 +1,27 @@
+import os, shutil, sys, tempfile
+import pytest
+
+# Main opens its data files relative to the working directory when it is imported, so the whole session
+# runs in a scratch directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="attendance-tests-")
+os.chdir(WORKDIR)
+os.environ["ATTENDANCE_BACKEND"] = "csv"
+# Voice commands are "heard" as VOICE_STUB_TEXT, with no microphone or network
+os.environ["VOICE_ENGINE"] = "stub"
+sys.path.insert(0, ROOT)
+
+import Main
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+def make_csv_storage(directory, students=()):
+    storage = Main.CSVStorage(os.path.join(directory, "students.csv"), os.path.join(directory, "attendance"))
+    storage.add_students(students)
+    return storage
+
+@pytest.fixture
+def csv_storage(tmp_path):
+    return make_csv_storage(str(tmp_path), [[f"S{i}", f"C{i % 3}", str(i)] for i in range(30)])
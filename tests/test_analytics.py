@@ -0,0 +1,101 @@
+import itertools, random
+from datetime import date, timedelta
+import pytest
+import Main
+from conftest import make_csv_storage
+
+BY = [dims for n in (1, 2, 3) for dims in itertools.permutations(Main.ROLLUP_DIMENSIONS, n)]
+RANGES = [(None, None), ("2025-01-15", "2025-04-02"), ("2025-01-15", None), (None, "2025-02-10"), ("2030-01-01", None)]
+
+def history(seed=5, students=60, days=160):
+    # Rows with mixed-case classes, a status outside STATUSES, dates written as 2025-9-3 and unreadable ones
+    rnd = random.Random(seed)
+    roster = [(f"S{i}", f"C{i % 7}" if i % 11 else f"c{i % 7}", str(100 + i)) for i in range(students)]
+    rows = []
+    for k in range(days):
+        d = date(2024, 11, 1) + timedelta(days=k)
+        text = d.isoformat() if k % 37 else f"{d.year}-{d.month}-{d.day}"
+        for name, cls, roll in rnd.sample(roster, students // 2):
+            rows.append({"Date": text, "Name": name, "Class": cls, "RollNo": roll,
+                         "Status": rnd.choice(["Present", "Present", "Absent", "Unclear", "Late"])})
+    rows.append({"Date": "garbage", "Name": "S0", "Class": "c0", "RollNo": "100", "Status": "Present"})
+    return rows
+
+def ordinal(text):
+    return Main.day_of(text).toordinal() if text else None
+
+@pytest.mark.skipif(Main.np is None, reason="NumPy is not installed")
+@pytest.mark.parametrize("start, end", RANGES)
+@pytest.mark.parametrize("cls", [None, "c3", "C1", "nope"])
+def test_numpy_and_python_engines_agree(start, end, cls):
+    rows = Main.attendance_columns(history(), Main.AttendanceTables())
+    for by in BY:
+        expected = Main.PythonAggregator().rollup(rows, by, ordinal(start), ordinal(end), cls)
+        found = Main.NumpyAggregator().rollup(rows, by, ordinal(start), ordinal(end), cls)
+        assert [(k, list(c)) for k, c in found] == [(k, list(c)) for k, c in expected], by
+
+def test_python_engine_matches_a_row_by_row_count():
+    rows = Main.attendance_columns(history(), Main.AttendanceTables())
+    expected = Main.summarize_month(r for r in history() if Main.day_of(r["Date"]) and r["Class"].lower() == "c2"
+                                     and date(2025, 1, 15) <= Main.day_of(r["Date"]) <= date(2025, 4, 2))
+    found = Main.PythonAggregator().rollup(rows, ("student",), ordinal("2025-01-15"), ordinal("2025-04-02"), "C2")
+    assert [dict(k, Present=p, Absent=a, Unclear=u) for k, (p, a, u) in found] == list(expected.values())
+
+def test_unreadable_dates_only_count_without_a_range_or_date_grouping():
+    rows = Main.attendance_columns(history(), Main.AttendanceTables())
+    engine = Main.aggregator
+    everyone = {k: c for k, c in engine.rollup(rows, ("student",))}
+    assert sum(map(sum, everyone.values())) == len(rows)
+    by_month = engine.rollup(rows, ("month",))
+    assert sum(sum(c) for _, c in by_month) == len(rows) - 1
+    assert [k for k, _ in by_month][:2] == [(("Month", "2024-11"),), (("Month", "2024-12"),)]
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_range_rollups_match_the_stored_rows(backend, tmp_path, monkeypatch):
+    if backend == "csv":
+        storage = make_csv_storage(str(tmp_path))
+    else:
+        storage = Main.SQLiteStorage(str(tmp_path / "attendance.db"))
+    rows = [r for r in history() if r["Date"] != "garbage"]
+    storage.add_students(sorted({(r["Name"], r["Class"], r["RollNo"]) for r in rows}))
+    storage.save_attendance_many([(r["Date"], r["RollNo"], r["Status"]) for r in rows])
+    monkeypatch.setattr(Main, "storage", storage)
+    for start, end in RANGES[1:4]:
+        expected = Main.summarize_month(r for r in storage.read_attendance()
+                                        if (day := Main.day_of(r["Date"])) and (not start or day >= Main.day_of(start))
+                                        and (not end or day <= Main.day_of(end)))
+        found = Main.rollup(("student",), start, end)
+        assert [{k: r[k] for k in ("Name", "Class", "Present", "Absent", "Unclear")} for r in found] == list(expected.values())
+        assert all(r["Records"] == r["Present"] + r["Absent"] + r["Unclear"] for r in found)
+
+def test_terms_may_run_into_the_next_year(monkeypatch):
+    monkeypatch.setattr(Main, "TERMS", Main.parse_terms("Autumn:09-01:12-20; Spring:01-05:04-10;Summer:04-20:07-15"))
+    assert Main.term_of(date(2025, 11, 3)) == "2025 Autumn"
+    assert Main.term_of(date(2025, 12, 25)) is None
+    monkeypatch.setattr(Main, "TERMS", Main.parse_terms("Term 2:10-01:03-31"))
+    assert Main.term_of(date(2026, 2, 10)) == "2025 Term 2"
+    assert Main.term_of(date(2025, 10, 1)) == "2025 Term 2"
+
+def test_rankings_share_ranks_on_equal_percentages(monkeypatch):
+    rollup = [{"Name": n, "Class": "A", "Present": p, "Records": r} for n, p, r in
+              [("a", 1, 2), ("b", 3, 3), ("c", 2, 4), ("d", 0, 1), ("e", 6, 6)]]
+    monkeypatch.setattr(Main, "rollup", lambda *args: [dict(r) for r in rollup])
+    # More records first among equal percentages
+    ranked = Main.attendance_rankings()
+    assert [(r["Name"], r["Rank"]) for r in ranked] == [("e", 1), ("b", 1), ("c", 3), ("a", 3), ("d", 5)]
+    assert [r["Name"] for r in Main.attendance_rankings(lowest=True, min_records=2)] == ["c", "a", "e", "b"]
+
+def test_rollup_and_ranking_endpoints():
+    client = Main.app.test_client()
+    Main.storage.add_students([["Ria", "AN1", "601"], ["Sam", "AN1", "602"]])
+    Main.save_attendance_many([("2024-03-04", "601", "Present"), ("2024-03-04", "602", "Absent"), ("2024-03-05", "602", "Present")])
+    body = client.get("/api/rollup?by=class,term&year=2024&class=an1").get_json()
+    assert body["engine"] == Main.aggregator.name
+    assert body["rows"] == [{"Class": "AN1", "Term": "2024 Term 1", "Present": 2, "Absent": 1, "Unclear": 0,
+                             "Records": 3, "Percentage": 66.7}]
+    ranked = client.get("/api/rankings?start=2024-03-01&end=2024-03-31&class=AN1&limit=1").get_json()
+    assert ranked["total"] == 2 and [r["Name"] for r in ranked["students"]] == ["Ria"]
+    assert client.get("/api/rollup?by=teacher").status_code == 400
+    assert client.get("/api/rollup?month=13").status_code == 400
+    assert client.get("/api/rankings?start=2024-3-x").status_code == 400
+    assert client.get("/api/rankings?order=up").status_code == 400
@@ -0,0 +1,49 @@
+from datetime import date
+import pytest
+import Main
+
+@pytest.mark.parametrize("query, command, args", [
+    ("add student bob class 10a roll 5", "add_student", {"name": "bob", "cls": "10a", "roll": "5"}),
+    ("Mark all of class 10A present except bob", "mark_class", {"cls": "10a", "status": "present", "exceptions": "bob"}),
+    ("mark everyone absent", "mark_class", {"cls": None, "status": "absent", "exceptions": None}),
+    ("mark alice bob and carol present, dave absent", "mark", {"groups": "alice bob and carol present, dave absent"}),
+    ("please show report for september", "show_report", {"month": "september"}),
+    ("show students", "show_students", {}),
+    ("show attendance 2025-09-01", "show_date", {"date_str": "2025-09-01"}),
+    ("delete student bob", "delete_student", {"name": "bob"}),
+    ("remove all students", "remove_all_students", {}),
+    ("add class 10b", "add_class", {"cls": "10b"}),
+])
+def test_grammar_picks_the_command(query, command, args):
+    assert Main.parse_nlp_command(query) == (command, args)
+
+@pytest.mark.parametrize("query, command", [
+    # When several commands occur in one query, the one registered first wins, wherever it appears
+    ("show report for september 2025-09-01", "show_report"),
+    ("show 2025-09-01 and add student bob class 10a roll 5", "add_student"),
+    ("mark all present", "mark_class"),
+    ("delete student bob then mark alice present", "mark"),
+])
+def test_grammar_prefers_earlier_commands(query, command):
+    assert Main.parse_nlp_command(query).command == command
+
+@pytest.mark.parametrize("query", ["show students now", "remove all students please", "what is the weather", ""])
+def test_grammar_rejects_other_text(query):
+    assert Main.parse_nlp_command(query) is None
+    assert Main.process_nlp_command(query) == (False, "❌ Sorry, I could not understand your command")
+
+def test_commands_reach_their_handlers():
+    Main.storage.add_students([["Alice", "NLP1", "901"], ["Bob", "NLP1", "902"], ["Carol", "NLP2", "903"]])
+    today = str(date.today())
+    assert Main.process_nlp_command("mark alise and bob absent, carol present")[0] is False
+    marks = Main.storage.attendance_for(today, ["901", "902", "903"])
+    assert {roll: r["Status"] for roll, r in marks.items()} == {"901": "Absent", "902": "Absent", "903": "Present"}
+    Main.process_nlp_command("mark all of class nlp1 present except bob")
+    marks = Main.storage.attendance_for(today, ["901", "902"])
+    assert {roll: r["Status"] for roll, r in marks.items()} == {"901": "Present", "902": "Absent"}
+
+@pytest.mark.parametrize("query", ["show 2025-09-01", "show report for september", "show students"])
+def test_html_results_render_on_the_dashboard(query):
+    Main.storage.add_students([["Dora", "NLP3", "904"]])
+    response = Main.app.test_client().post("/nlp_command", data={"query": query})
+    assert response.status_code == 200
@@ -0,0 +1,176 @@
+import os, re, subprocess, sys
+from werkzeug.test import EnvironBuilder
+import Main
+
+def test_static_assets_are_cached_for_a_year():
+    client = Main.app.test_client()
+    response = client.get("/static/dashboard.css")
+    assert response.status_code == 200
+    assert response.cache_control.max_age == 365 * 24 * 3600
+    response.close()
+
+def test_month_pdf_is_not_cached():
+    response = Main.app.test_client().get("/download_pdf?month=9&year=2025")
+    assert response.status_code == 200 and response.mimetype == "application/pdf"
+    assert response.cache_control.max_age == 0
+    assert response.expires is None or response.expires <= response.date
+
+def test_pdf_worker_processes_are_not_forked(monkeypatch):
+    monkeypatch.setattr(Main, "PDF_PROCESSES", 1)
+    monkeypatch.setattr(Main, "pdf_processes", None)
+    Main.storage.add_students([["Pia", "PDF1", "801"]])
+    Main.save_attendance("2025-09-02", "801", "Present")
+    try:
+        assert Main.render_month_pdf(9, 2025).startswith(b"%PDF-")
+        assert Main.pdf_processes._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        Main.pdf_processes.shutdown()
+
+def test_mark_rejects_unknown_statuses():
+    Main.storage.add_students([["Max", "MK1", "701"]])
+    client = Main.app.test_client()
+    assert client.get("/mark/701/Late/2025-09-03").status_code == 400
+    assert Main.storage.get_attendance("2025-09-03", "701") is None
+    assert client.get("/mark/701/absent/2025-09-03").status_code == 302
+    assert Main.storage.get_attendance("2025-09-03", "701")["Status"] == "Absent"
+
+def test_mark_bulk_rejects_bad_payloads_without_storing():
+    Main.storage.add_students([["Bea", "MK2", "702"]])
+    client = Main.app.test_client()
+    bad = [{"date": "2025-09-04", "marks": [["702", "Late"]]},
+           {"date": "2025-09-04", "marks": [["702"]]},
+           {"date": "2025-09-04", "marks": "abc"},
+           {"date": "2025-09-04", "marks": [["702", 1]]},
+           {"date": "2025-09-04", "class": "MK2", "except": "702"},
+           {"date": "2025-13-40", "marks": [["702", "Present"]]},
+           ["702", "Present"]]
+    for payload in bad:
+        assert client.post("/mark_bulk", json=payload).status_code == 400, payload
+    assert client.post("/mark_bulk", data={"date": "garbage", "status_702": "Present"}).status_code == 400
+    assert client.post("/mark_bulk", data={"date": "2025-09-04", "status_702": "Late"}).status_code == 400
+    assert client.get("/mark/702/Present/garbage").status_code == 400
+    assert Main.storage.get_attendance("2025-09-04", "702") is None
+    response = client.post("/mark_bulk", json={"date": "2025-09-04", "marks": [["702", "present"]]})
+    assert response.status_code == 200 and response.get_json()["marked"] == 1
+    assert Main.storage.get_attendance("2025-09-04", "702")["Status"] == "Present"
+
+def test_exports_reject_out_of_range_months():
+    client = Main.app.test_client()
+    for query in ("month=13&year=2025", "month=-1&year=2025", "month=9&year=-5", "month=9&year=10000"):
+        assert client.get("/download_pdf?" + query).status_code == 400, query
+        assert client.get("/download_csv?" + query).status_code == 400, query
+
+def test_profiling_passes_event_streams_through(monkeypatch, tmp_path):
+    monkeypatch.setattr(Main, "PROFILE_TOKEN", "t0ken")
+    monkeypatch.setattr(Main, "PROFILE_DIR", str(tmp_path))
+    wsgi = Main.ProfileMiddleware(Main.app.wsgi_app)
+    started = []
+    def start_response(status, headers, exc_info=None):
+        started.append(dict(headers))
+    body = wsgi(EnvironBuilder("/api/events", headers={"X-Profile": "t0ken"}).get_environ(), start_response)
+    try:
+        assert next(iter(body)) == b"retry: 3000\n\n"
+        assert "X-Profile-Id" not in started[0] and not os.listdir(tmp_path)
+        assert Main.profile_lock.acquire(blocking=False)
+        Main.profile_lock.release()
+    finally:
+        body.close()
+    body = wsgi(EnvironBuilder("/api/students", headers={"X-Profile": "t0ken"}).get_environ(), start_response)
+    profile_id = started[1]["X-Profile-Id"]
+    assert b"".join(body).startswith(b"{") and os.path.exists(os.path.join(tmp_path, profile_id + ".prof"))
+
+def test_dashboard_renders_one_page_of_a_class():
+    Main.storage.add_students([[f"Pg{i}", "PG1", f"9{i:02d}"] for i in range(30)])
+    client = Main.app.test_client()
+    def rolls(query):
+        html = client.get("/?" + query).get_data(as_text=True)
+        return re.findall(r'class="card" data-roll="([^"]+)"', html), html
+    first, html = rolls("class=PG1&per_page=12")
+    assert first == [f"9{i:02d}" for i in range(12)] and "Page 1 of 3" in html
+    last, html = rolls("class=PG1&per_page=12&page=3")
+    assert last == [f"9{i:02d}" for i in range(24, 30)] and "Page 3 of 3" in html
+    assert rolls("class=PG1&per_page=12&page=99")[0] == last
+    assert len(rolls("class=PG1&per_page=0")[0]) == 1
+    assert len(rolls("per_page=10")[0]) == 10
+
+def test_json_api_round_trip():
+    client = Main.app.test_client()
+    assert client.post("/api/students", json={"name": "Jo", "class": "JA1"}).status_code == 400
+    response = client.post("/api/students", json={"name": "Jo", "class": "JA1", "rollno": "1001"})
+    assert response.status_code == 201 and response.get_json() == {"Name": "Jo", "Class": "JA1", "RollNo": "1001"}
+    client.post("/api/students", json={"name": "Kit", "class": "JA1", "rollno": "1002"})
+    page = client.get("/api/students?class=JA1&per_page=1&page=2").get_json()
+    assert [s["RollNo"] for s in page["students"]] == ["1002"] and (page["total"], page["pages"]) == (2, 2)
+
+    assert client.put("/api/attendance/2025-09-05/1001", json={"status": "Late"}).status_code == 400
+    assert client.put("/api/attendance/2025-9-40/1001", json={"status": "Present"}).status_code == 400
+    assert client.put("/api/attendance/2025-09-05/nobody", json={"status": "Present"}).status_code == 404
+    marked = client.put("/api/attendance/2025-09-05/1001?class=JA1", json={"status": "absent"}).get_json()
+    assert marked["record"]["Status"] == "Absent" and marked["counts"]["Absent"] == 1
+
+    day = client.get("/api/attendance/2025-09-05?class=JA1").get_json()
+    assert [(r["RollNo"], r["Status"]) for r in day["records"]] == [("1001", "Absent"), ("1002", "Not Marked")]
+    assert day["date"] == "2025-09-05" and day["counts"]["Absent"] == 1
+    assert client.get("/api/attendance/garbage").status_code == 400
+
+    month = client.get("/api/month/2025/9?details=1").get_json()
+    assert any(r["RollNo"] == "1001" and r["Status"] == "Absent" for r in month["details"])
+    assert client.get("/api/month/2025/13").status_code == 400
+
+    assert client.delete("/api/students/1002").get_json() == {"deleted": "1002"}
+    assert client.delete("/api/students/1002").status_code == 404
+
+def test_event_stream_sends_replays_and_resets(monkeypatch):
+    monkeypatch.setattr(Main, "SSE_HEARTBEAT_SECONDS", 0.05)
+    Main.storage.add_students([["Eve", "EV1", "1101"]])
+    client = Main.app.test_client()
+    def stream(**headers):
+        response = client.get("/api/events", headers=headers, buffered=False)
+        assert response.mimetype == "text/event-stream"
+        chunks = response.iter_encoded()
+        assert next(chunks) == b"retry: 3000\n\n"
+        return response, chunks
+
+    live, chunks = stream()
+    assert next(chunks) == b": keepalive\n\n"
+    Main.save_attendance("2025-09-06", "1101", "Present")
+    event = next(chunks).decode()
+    live.close()
+    event_id = int(event.split("\n", 1)[0][len("id: "):])
+    assert "\nevent: marks\n" in event and '"RollNo":"1101","Status":"Present"' in event
+    assert '"ev1":{"Present":1' in event
+
+    replay, chunks = stream(**{"Last-Event-ID": str(event_id - 1)})
+    assert next(chunks).decode() == event
+    replay.close()
+
+    monkeypatch.setattr(Main, "event_hub", Main.EventHub(2))
+    for n in range(3):
+        Main.event_hub.publish("marks", {"n": n})
+    behind, chunks = stream(**{"Last-Event-ID": "0"})
+    assert next(chunks) == b"id: 3\nevent: reset\ndata: {}\n\n"
+    behind.close()
+
+METRICS_SCRIPT = """
+import Main
+client = Main.app.test_client()
+client.post("/api/students", json={"name": "Mo", "class": "ME1", "rollno": "1"})
+client.put("/api/attendance/2025-09-07/1", json={"status": "Present"})
+client.get("/api/month/2025/9")
+client.get("/api/month/2025/9")
+print(client.get("/metrics").get_data(as_text=True))
+"""
+
+def test_metrics_endpoint(tmp_path):
+    assert Main.app.test_client().get("/metrics").status_code == 404
+    # The request hooks are installed at import, so this runs in a fresh interpreter with metrics on
+    env = dict(os.environ, ATTENDANCE_METRICS="1", PYTHONPATH=os.path.dirname(Main.__file__))
+    out = subprocess.run([sys.executable, "-c", METRICS_SCRIPT], cwd=tmp_path, env=env, capture_output=True,
+                         text=True, check=True).stdout.splitlines()
+    month = 'route="/api/month/<int:year>/<int:month>",method="GET",status="200"'
+    assert f"attendance_request_seconds_count{{{month}}} 2" in out
+    assert f'attendance_request_seconds_bucket{{{month},le="+Inf"}} 2' in out
+    assert "# TYPE attendance_span_seconds histogram" in out and "# TYPE attendance_rows_scanned_total counter" in out
+    assert any(line.startswith('attendance_span_seconds_count{span="storage.commit_marks",route="background"}') for line in out)
+    assert any(line.startswith('attendance_rows_scanned_total{backend="csv",table=') and 'route="/api/month' in line
+               for line in out)
@@ -0,0 +1,160 @@
+import csv, os, random, threading, time
+import pytest
+import Main
+from conftest import make_csv_storage
+
+def file_rows(storage, name):
+    with open(os.path.join(storage.attendance_dir, name + ".csv"), newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_last_mark_wins_and_compaction_folds_the_log(csv_storage):
+    for status in ("Present", "Absent", "Unclear", "Absent"):
+        csv_storage.save_attendance("2025-09-01", "1", status)
+    csv_storage.save_attendance("2025-09-01", "2", "Present")
+    assert len(file_rows(csv_storage, "2025-09")) == 5
+
+    csv_storage.partition("2025-09").compact()
+    rows = file_rows(csv_storage, "2025-09")
+    assert [(r["RollNo"], r["Status"]) for r in rows] == [("1", "Absent"), ("2", "Present")]
+    assert csv_storage.get_attendance("2025-09-01", "1")["Status"] == "Absent"
+    assert csv_storage.month_summary(9, 2025)[("S1", "C1")]["Absent"] == 1
+
+def test_compaction_keeps_concurrent_appends(csv_storage, tmp_path):
+    # A second storage on the same files stands in for another process; it compacts while both append
+    other = make_csv_storage(str(tmp_path))
+    csv_storage.save_attendance("2025-09-01", "0", "Present")
+    expected, lock = {("2025-09-01", "0"): "Present"}, threading.Lock()
+    done, compactions, errors = threading.Event(), [], []
+
+    def writer(storage, rolls, seed):
+        rnd = random.Random(seed)
+        for _ in range(150):
+            marks = [(f"2025-09-{rnd.randint(1, 28):02d}", rnd.choice(rolls), rnd.choice(Main.STATUSES)) for _ in range(4)]
+            storage.save_attendance_many(marks)
+            with lock:
+                for on_date, rollno, status in marks:
+                    expected[(on_date, rollno)] = status
+
+    def compactor():
+        try:
+            while not done.is_set():
+                other.partition("2025-09").compact()
+                compactions.append(1)
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=writer, args=(csv_storage, [str(i) for i in range(0, 15)], 1)),
+               threading.Thread(target=writer, args=(other, [str(i) for i in range(15, 30)], 2))]
+    compacting = threading.Thread(target=compactor)
+    compacting.start()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    done.set()
+    compacting.join()
+    assert not errors and len(compactions) > 1
+
+    for storage in (csv_storage, other, make_csv_storage(str(tmp_path))):
+        found = {(r["Date"], r["RollNo"]): r["Status"] for r in storage.month_rows(9, 2025)}
+        assert found == expected
+    rows = file_rows(csv_storage, "2025-09")
+    assert all(len(r) == len(Main.ATTENDANCE_FIELDS) and None not in r for r in rows)
+    latest = {(r["Date"], r["RollNo"]): r["Status"] for r in rows}
+    assert latest == expected
+
+def test_any_number_of_distinct_statuses_loads(csv_storage):
+    # Files written by older versions may hold arbitrary status text; each one gets its own number
+    with open(os.path.join(csv_storage.attendance_dir, "2025-10.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(Main.ATTENDANCE_FIELDS)
+        writer.writerows([f"2025-10-{1 + i % 28:02d}", f"S{i % 30}", f"C{i % 30 % 3}", str(i % 30), f"S{i}"] for i in range(300))
+        writer.writerow(["2025-10-01", "S0", "C0", "0", "Present"])
+    summary, rows = csv_storage.month_data(10, 2025)
+    assert len(rows) == 300 and rows[0]["Status"] == "Present" and rows[299]["Status"] == "S299"
+    assert sum(r["Unclear"] for r in summary.values()) == 299
+    csv_storage.save_attendance("2025-10-02", "1", "Absent")
+    assert csv_storage.get_attendance("2025-10-02", "1")["Status"] == "Absent"
+
+def test_write_queue_batches_marks_from_one_writer_in_order(csv_storage, monkeypatch):
+    batches, writers, busy = [], set(), []
+    commit = csv_storage.commit_marks
+
+    def recording_commit(marks):
+        assert not busy, "two commits at once"
+        busy.append(1)
+        try:
+            writers.add(threading.get_ident())
+            batches.append(list(marks))
+            time.sleep(0.002)
+            return commit(marks)
+        finally:
+            busy.pop()
+
+    monkeypatch.setattr(csv_storage, "commit_marks", recording_commit)
+    submitted = {}
+
+    def caller(n):
+        rnd = random.Random(n)
+        marks = submitted[n] = []
+        for i in range(40):
+            batch = [("2025-09-01", str(n), rnd.choice(Main.STATUSES)), (f"2025-09-{2 + i % 20:02d}", str(n), "Present")]
+            marks.extend(batch)
+            csv_storage.save_attendance_many(batch)
+
+    callers = [threading.Thread(target=caller, args=(n,)) for n in range(8)]
+    for t in callers:
+        t.start()
+    for t in callers:
+        t.join()
+
+    committed = [m for batch in batches for m in batch]
+    assert sorted(committed) == sorted(m for marks in submitted.values() for m in marks)
+    for n, marks in submitted.items():
+        assert [m for m in committed if m[1] == str(n)] == marks
+    assert len(writers) == 1 and len(batches) < 8 * 40
+    for n, marks in submitted.items():
+        assert csv_storage.get_attendance("2025-09-01", str(n))["Status"] == [m for m in marks if m[0] == "2025-09-01"][-1][2]
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_ranges_skip_undated_rows(backend, tmp_path):
+    if backend == "csv":
+        storage = make_csv_storage(str(tmp_path))
+    else:
+        storage = Main.SQLiteStorage(str(tmp_path / "attendance.db"))
+    storage.add_students([["Ann", "R1", "1"]])
+    storage.save_attendance_many([("2025-09-01", "1", "Present"), ("garbage", "1", "Absent"), ("2025-10-01", "1", "Unclear")])
+    assert len(list(storage.iter_attendance())) == 3
+    for start, end in [("2025-01-01", None), (None, "2025-12-31"), ("2025-09-01", "2025-09-30")]:
+        dates = [r["Date"] for r in storage.iter_attendance(start, end)]
+        assert "garbage" not in dates and dates[0] == "2025-09-01"
+
+@pytest.mark.parametrize("backend", ["csv", "sqlite"])
+def test_listeners_see_only_committed_marks_and_cannot_fail_the_write(backend, tmp_path):
+    if backend == "csv":
+        storage = make_csv_storage(str(tmp_path))
+    else:
+        storage = Main.SQLiteStorage(str(tmp_path / "attendance.db"))
+    storage.add_students([["Ann", "L1", "1"]])
+    seen = []
+
+    def broken(months):
+        raise RuntimeError("listener bug")
+
+    storage.on_change(broken)
+    storage.on_marks(seen.append)
+    storage.save_attendance_many([("2025-09-01", "1", "Present"), ("2025-09-01", "nobody", "Absent")])
+    storage.save_attendance("2025-09-02", "nobody", "Absent")
+    assert seen == [[("2025-09-01", "1", "Present")]]
+    assert storage.get_attendance("2025-09-01", "1")["Status"] == "Present"
+
+def test_sqlite_month_columns_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(Main, "REPORT_CACHE_SIZE", 2)
+    storage = Main.SQLiteStorage(str(tmp_path / "attendance.db"))
+    storage.add_students([["Ann", "Q1", "1"]])
+    storage.save_attendance_many([(f"2025-{m:02d}-01", "1", "Present") for m in (1, 2, 3)])
+    for m in (1, 2, 3):
+        assert len(storage.month_columns(m, 2025)) == 1
+    assert [k[1] for k in storage.columns.entries] == [2, 3]
+    storage.save_attendance("2025-03-02", "1", "Absent")
+    assert len(storage.month_columns(3, 2025)) == 2
@@ -0,0 +1,65 @@
+import io, threading
+import pytest
+import Main
+
+@pytest.fixture
+def client():
+    return Main.app.test_client()
+
+def submit(client, **kwargs):
+    response = client.post("/nlp_voice", headers={"Accept": "application/json"}, **kwargs)
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job["status"] == "pending" and job["url"] == f"/nlp_voice/{job['job']}"
+    return job["job"]
+
+def test_voice_job_reports_the_recognized_text(client):
+    job = submit(client)
+    assert client.get(f"/nlp_voice/{job}?wait=5").get_json() == {"job": job, "status": "done", "text": "show students"}
+
+def test_uploaded_audio_is_recognized_too(client, monkeypatch):
+    monkeypatch.setattr(Main, "speech_engine", Main.StubEngine("Mark Alice Present"))
+    job = submit(client, data={"audio": (io.BytesIO(b"RIFF...."), "command.wav")})
+    assert client.get(f"/nlp_voice/{job}?wait=5").get_json()["text"] == "mark alice present"
+
+def test_pending_job_asks_to_retry(client, monkeypatch):
+    heard = threading.Event()
+
+    class SlowEngine(Main.StubEngine):
+        def recognize(self, audio):
+            heard.wait(5)
+            return "show students"
+
+    monkeypatch.setattr(Main, "speech_engine", SlowEngine())
+    job = submit(client)
+    response = client.get(f"/nlp_voice/{job}")
+    assert response.get_json()["status"] == "pending" and response.headers["Retry-After"] == "1"
+    heard.set()
+    assert client.get(f"/nlp_voice/{job}?wait=5").get_json()["status"] == "done"
+
+def test_recognition_errors_are_reported(client, monkeypatch):
+    class DeafEngine(Main.StubEngine):
+        def recognize(self, audio):
+            raise RuntimeError("no microphone")
+
+    monkeypatch.setattr(Main, "speech_engine", DeafEngine())
+    status = client.get(f"/nlp_voice/{submit(client)}?wait=5").get_json()
+    assert status["status"] == "error" and "no microphone" in status["error"]
+
+def test_browser_is_sent_to_the_dashboard_to_poll(client):
+    response = client.post("/nlp_voice")
+    assert response.status_code == 302
+    job = response.headers["Location"].split("voice_job=")[1]
+    page = client.get(response.headers["Location"])
+    assert page.status_code == 200 and job in page.get_data(as_text=True)
+
+def test_unknown_job_is_404(client):
+    assert client.get("/nlp_voice/nope").status_code == 404
+
+def test_finished_audio_streams_are_forgotten(client, monkeypatch):
+    # Only the browser upload path is used here, so opening streams must expire old jobs too
+    client.post("/nlp_audio?final=1&run=0", data=b"", content_type="audio/wav")
+    assert Main.voice_jobs
+    monkeypatch.setattr(Main, "VOICE_JOB_TTL", 0)
+    client.post("/nlp_audio?final=1&run=0", data=b"", content_type="audio/wav")
+    assert len(Main.voice_jobs) == 1